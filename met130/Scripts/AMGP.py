@@ -35,15 +35,19 @@
 ################################################
 
 from datetime import datetime, timedelta
-from io import StringIO
+from io import TextIOWrapper, UnsupportedOperation
+from io import BytesIO
 from urllib.request import urlopen
+from urllib.parse import urlparse
 from siphon.simplewebservice.iastate import IAStateUpperAir
 from siphon.catalog import TDSCatalog
 
 import cartopy.crs as ccrs
-from metpy.io import add_station_lat_lon
+from metpy.io import station_info
 from metpy.io import metar
 from metpy.plots import declarative
+from matplotlib import pyplot as plt
+from traitlets import Int, List, Unicode
 from metpy.units import units
 import metpy.calc as mpcalc
 import xarray as xr
@@ -57,6 +61,21 @@ from PIL import Image
 import json
 import glob
 import contextlib
+import hashlib
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+try:
+    import dask
+except ImportError:
+    dask = None
+from time import monotonic
+from time import sleep
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
 
 import warnings
 warnings.filterwarnings('ignore', category=FutureWarning)
@@ -65,6 +84,23 @@ warnings.filterwarnings('ignore', category=UserWarning)
 
 version = "0.2.0"
 
+# Every gridded field that a map can ask for; anything else in a model dataset is never pulled
+griddedFields = ['Temperature_height_above_ground', 'u-component_of_wind_height_above_ground', 'v-component_of_wind_height_above_ground',
+                 'Dewpoint_temperature_height_above_ground', 'Pressure_reduced_to_MSL_msl', 'Temperature_isobaric',
+                 'u-component_of_wind_isobaric', 'v-component_of_wind_isobaric', 'Geopotential_height_isobaric',
+                 'Relative_humidity_isobaric', 'Absolute_vorticity_isobaric']
+
+# The only columns of the Valpo daily METAR archive that surface maps use
+surfaceColumns = ['station_id', 'latitude', 'longitude', 'date_time', 'air_temperature', 'dew_point_temperature',
+                  'air_pressure_at_sea_level', 'present_weather', 'eastward_wind', 'northward_wind', 'cloud_coverage']
+
+# Grid cells kept past the data display area on every side, so that finite differences at the
+# edge of the subset use real neighbours instead of one-sided ones
+gridHalo = 2
+
+# Mandatory levels that get their own ready-made slice of each sounding cycle
+mandatoryLevels = [1000, 925, 850, 700, 500, 300, 250, 200]
+
 # Opening the config file and manual
 if os.path.isfile("config.json"):
     with open("config.json", "r") as cfg:
@@ -82,6 +118,22 @@ def setTime():
     global currentTime
     currentTime = datetime.utcnow()
     
+# The prefetcher keeps its own clock, so the interactive session's idea of 'recent' never moves
+# under it. Data code reads the time through Now(), which gives the calling thread's clock if it
+# has one, and the session's otherwise.
+clock = threading.local()
+
+def Now():
+    return getattr(clock, 'now', currentTime)
+
+# Runs a call with the thread's clock set, so fetches on pool threads see the caller's time
+def AtTime(now, call, *args):
+    clock.now = now
+    try:
+        return call(*args)
+    finally:
+        del clock.now
+    
 def getTime():
     global currentTime
     currentTime = datetime.utcnow()
@@ -113,6 +165,9 @@ def inputChain():
         print("<list> Type 'edit Factors {(optional) add/remove} {value}' to edit loaded factors.")
         print("<list> Type 'save {preset name}' to save the current settings as a preset.")
         print("<list> Type 'run' to run with the current settings.")
+        print("<list> Type 'sync {YYYYMMDDHH} {YYYYMMDDHH} {(optional) channels} {(optional) fch=0,6,...}' to mirror the data for a date range to local disk.")
+        print("<list> Type 'prefetch {on/off}' to pull each new cycle for the saved presets in the background.")
+        print("<list> Type 'precision' to check the loaded map's contours at working precision against float64.")
         print("<list> Type 'quit' to exit without running.")
         inputChain()
     
@@ -150,19 +205,21 @@ def inputChain():
         print("<factors> 'relative_vorticity_fill' - Gridded relative vorticity")
         print("<factors> 'absolute_vorticity_fill' - Gridded absolute vorticity (upper-air only)")
         print("<factors> 'pressure_contours' - Gridded pressure contours (surface only)")
-        print("<factors> 'dew_contours' - Gridded dewpoint contours (surface only)")
+        print("<factors> 'dew_contours' - Gridded dewpoint contours")
+        print("<factors> 'dewpoint_depression_fill' - Gridded dewpoint depression")
+        print("<factors> 'mixing_ratio_contours' - Gridded mixing ratio contours (upper-air only)")
         print("<factors> 'thickness_500_1000' - Gridded 500mb to 1000mb thickness contours")
         print("<factors> 'gridded_barbs' - Gridded winds")
         print("<factors> 'sat_channel_2' - Visible satelite data")
         print("<factors> 'sat_channel_9' - Water vapor satelite data")
         print("<factors> 'sat_channel_14' - Infrared satelite data")
-        print("<factors> 'sat_truecolor' - COMING SOON, once MetPy updates")
+        print("<factors> 'sat_truecolor' - True color satelite imagery")
         inputChain()
     elif command[0] == 'paste':
         singleLoads()
         inputChain()
     elif command[0] == 'edit':
-        if command[1] in ["Level", "Date", "Delta", "Factors", "Area", "DPI", "Scale", "PRF", "BF", "Smooth", "Projection"]:
+        if command[1] in ["Level", "Date", "Delta", "Factors", "Area", "DPI", "Scale", "PRF", "BF", "Smooth", "Kernel", "Projection"]:
             if command[1] == "Level":
                 loaded.update({'level':command[2]})
             if command[1] == "Date":
@@ -212,6 +269,11 @@ def inputChain():
                 loaded.update({'barbfactor':command[2]})
             if command[1] == "Smooth":
                 loaded.update({'smoothing':command[2]})
+            if command[1] == "Kernel":
+                if command[2] in smoothingKernels:
+                    loaded.update({'kernel':command[2]})
+                else:
+                    print(f"<error> That is not a valid kernel! Kernels: {', '.join(smoothingKernels)}")
             if command[1] == "Projection":
                 loaded.update({'projection':command[2]})
             singleLoads()
@@ -249,6 +311,25 @@ def inputChain():
         product = run(loaded, title)
         SaveMap(product, S, A, title, noShow)
         inputChain()
+    elif command[0] == 'prefetch':
+        if command[1] == 'on':
+            StartPrefetch()
+            print("<prefetch> Background prefetching is on.")
+        else:
+            StopPrefetch()
+            print("<prefetch> Background prefetching is off.")
+        inputChain()
+    elif command[0] == 'sync':
+        start = datetime.strptime(command[1], '%Y%m%d%H')
+        end = datetime.strptime(command[2], '%Y%m%d%H')
+        channels = [int(chan) for chan in command[3:] if not chan.startswith('fch=')]
+        fchours = [int(fch) for arg in command[3:] if arg.startswith('fch=') for fch in arg[4:].split(',')]
+        Sync(start, end, channels, fchours)
+        print("<sync> Mirror is up to date.")
+        inputChain()
+    elif command[0] == 'precision':
+        PrecisionCheck(loaded)
+        inputChain()
     elif command[0] == 'mode':
         global mode
         if command[1] == "multi":
@@ -393,31 +474,23 @@ def multiMode():
             dates.append(dloop * jump)
             dloop = dloop + 1
         
-        overrides = {}
+        overrides = {'session':DataSession(levels, fchours, loaded['factors'].split(", "))}
         for fch in fchours:
             for dt in dates:
                 for lvl in levels:
                     overrides.update({'fcHour':fch,'level':lvl,'date':FromDatetime((ParseTime(date).time + timedelta(hours=dt))).ToString()})
-                    product = run(loaded, '', **overrides)
-                    if gif:
-                        panels.append(product)
-                        print("<run> Map panel created successfully")
-                    else:
-                        SaveMap(product, True, doAssign, '', True)
+                    panels.append(run(dict(loaded), '', **overrides))
+                    print("<run> Map panel created successfully")
                         
+        # Every frame is built first, then all of them are drawn at once
         if gif:
-            c = 0
-            for panel in panels:
-                SaveMap(panel, False, False, f'{c:03d}', True)
-                #if c == 0:
-                #    SaveMap(panel, False, False, f'{c:03d}c', True)
-                c = c + 1
+            RenderFrames(panels, False, False, True)
             frames = []
             '''if np.sign(Set['dloop']) == -1:
                 for image in glob.glob("../Maps/Temp/*.png"):
                     frames.append(Image.open(image))
             else:'''
-            for image in reversed(glob.glob("../Maps/Temp/*.png")):
+            for image in reversed(sorted(glob.glob("../Maps/Temp/*.png"))):
                 frames.append(Image.open(image))
             frame_one = frames[0]
             if doAssign:
@@ -426,6 +499,8 @@ def multiMode():
                 frame_one.save(f"../Maps/Test_Maps/{gifname}.gif", format="GIF", append_images=frames, save_all=True, duration=1500, loop=0)
             print("<run> Gif created successfully")
             ClearTemp()
+        else:
+            RenderFrames(panels, True, doAssign, False)
             
         multiMode()
         
@@ -473,7 +548,7 @@ def cfgUpdate():
 # Save a preset to the config file
 
 def save(name):
-    saveState = {"level":f"{loaded['level']}","date":f"{loaded['date']}","delta":f"{loaded['delta']}","factors":f"{loaded['factors']}","area":f"{loaded['area']}","dpi":f"{loaded['dpi']}","scale":f"{loaded['scale']}","prfactor":f"{loaded['prfactor']}","barbfactor":f"{loaded['barbfactor']}","smoothing":f"{loaded['smoothing']}","projection":f"{loaded['projection']}"}
+    saveState = {"level":f"{loaded['level']}","date":f"{loaded['date']}","delta":f"{loaded['delta']}","factors":f"{loaded['factors']}","area":f"{loaded['area']}","dpi":f"{loaded['dpi']}","scale":f"{loaded['scale']}","prfactor":f"{loaded['prfactor']}","barbfactor":f"{loaded['barbfactor']}","smoothing":f"{loaded['smoothing']}","kernel":f"{loaded.get('kernel', 'zoom')}","projection":f"{loaded['projection']}"}
     print(name, saveState)
     config['presets']['plots'][f'{name}'] = saveState
     with open("config.json", "w") as J:
@@ -500,6 +575,7 @@ def singleLoads():
     print(f"<loaded> PRF (Point Reduction Scale): {loaded['prfactor']}")
     print(f"<loaded> BF (Barb Factor): {loaded['barbfactor']}")
     print(f"<loaded> Smooth: {loaded['smoothing']}")
+    print(f"<loaded> Kernel: {loaded.get('kernel', 'zoom')}")
     print(f"<loaded> Projection: {loaded['projection']}")
 
 def multiLoads():
@@ -516,6 +592,7 @@ def multiLoads():
     
 class Time(object):
     def __init__(self, Date):
+        currentTime = Now()
         rec = False
         splitDate = Date.split(", ")
         if splitDate[0] == 'recent':
@@ -644,9 +721,680 @@ def FromDatetime(datetimeObj):
         customTimeFormat = f"{datetimeObj.year}, {datetimeObj.month}, {datetimeObj.day}, {datetimeObj.hour}"
         newTime = ParseTime(customTimeFormat)
         return newTime
+
+# Where every kind of data lives on its home server
+sourceUrls = {'surface_archive':'http://bergeron.valpo.edu/archive_surface_data/{time:%Y}/{time:%Y%m%d}_metar.csv',
+              'surface_current':'http://bergeron.valpo.edu/current_surface_data/{time:%Y%m%d%H}_sao.wmo',
+              'upper_air':'https://mesonet.agron.iastate.edu/json/raob.py?ts={time:%Y%m%d%H%M}',
+              'gfs_recent':'https://thredds.ucar.edu/thredds/dodsC/grib/NCEP/GFS/Global_onedeg/GFS_Global_onedeg_{run:%Y%m%d}_{run:%H%M}.grib2',
+              'narr':'https://www.ncei.noaa.gov/thredds/dodsC/model-narr-a-files/{run:%Y%m/%Y%m%d}/narr-a_221_{run:%Y%m%d_%H}00_000.grb',
+              'goes_catalog':'https://thredds.ucar.edu/thredds/catalog/satellite/goes/{sat}/products/CloudAndMoistureImagery/{region}/Channel{chan:02d}/{day:%Y%m%d}/catalog.xml'}
+
+def SourceUrl(name, **fields):
+    return sourceUrls[name].format(**fields)
+
+# Data source backends. Every fetch in AMGP names its data by the home server URL, and the
+# backend chosen in config.json decides where that data actually comes from.
+class RemoteSource(object):
+    name = 'remote'
+    
+    def __init__(self):
+        self.catalogs = {}
+    
+    def Table(self, url, **kwargs):
+        return pd.read_csv(url, **kwargs)
+    
+    def Stream(self, url):
+        return urlopen(url)
+    
+    def Soundings(self, url, cycleTime):
+        return IAStateUpperAir.request_all_data(cycleTime)
+    
+    def Gridded(self, url):
+        return xr.open_dataset(url)
+    
+    # Which server holds a model run depends on its age, so runs are named by their home server URL
+    def RunUrl(self, runTime):
+        return None
+    
+    # A cheap OPeNDAP metadata request, to see whether an endpoint serves a file without opening it
+    def Exists(self, url):
+        try:
+            with urlopen(f"{url}.dds", timeout=float(config.get('timeouts', {}).get('probe', 30))):
+                return True
+        except:
+            return False
+    
+    def SatelliteFiles(self, url):
+        self.catalogs[url] = TDSCatalog(url)
+        return list(self.catalogs[url].datasets)
+    
+    def Satellite(self, url, name):
+        if url in self.catalogs:
+            return self.catalogs[url].datasets[name].remote_access(use_xarray=True)
+        # Without a parsed catalog, go straight to the file's OPeNDAP endpoint
+        return xr.open_dataset(url.replace('/catalog/', '/dodsC/').replace('catalog.xml', name))
+
+# Reads a local copy of the home servers laid out by host and path, as written by Sync()
+class MirrorSource(object):
+    name = 'mirror'
+    
+    def __init__(self, directory):
+        self.dir = directory
+    
+    def Path(self, url):
+        parsed = urlparse(url)
+        return f"{self.dir}/{parsed.netloc}{parsed.path}"
+    
+    def Table(self, url, **kwargs):
+        return pd.read_csv(self.Path(url), **kwargs)
+    
+    def Stream(self, url):
+        return open(self.Path(url), 'rb')
+    
+    def Soundings(self, url, cycleTime):
+        return LoadFrame(f"{self.Path(url)}_{cycleTime:%Y%m%d%H}.pkl")
+    
+    def Gridded(self, url):
+        return xr.open_dataset(f"{self.Path(url)}.nc")
+    
+    # Mirrored model runs are kept under the run's own name rather than the URL of whichever server
+    # they were synced from, so a run reads the same however old it gets
+    def RunUrl(self, runTime):
+        return f"mirror://gridded/{runTime:%Y%m%d%H}"
+    
+    def Exists(self, url):
+        return os.path.isfile(f"{self.Path(url)}.nc")
+    
+    def SatelliteFiles(self, url):
+        with open(f"{self.Path(url)}.json", "r") as J:
+            return json.load(J)
+    
+    def Satellite(self, url, name):
+        return xr.open_dataset(f"{os.path.dirname(self.Path(url))}/{name}")
+
+# Serves objects registered in memory under their home server URL, for benchmarks and tests
+class FixtureSource(object):
+    name = 'fixtures'
+    
+    def __init__(self):
+        self.fixtures = {}
+    
+    def Add(self, url, obj):
+        self.fixtures[url] = obj
+    
+    def Table(self, url, **kwargs):
+        return self.fixtures[url].copy()
+    
+    def Stream(self, url):
+        return BytesIO(self.fixtures[url])
+    
+    def Soundings(self, url, cycleTime):
+        return self.fixtures[url].copy()
+    
+    def Gridded(self, url):
+        return self.fixtures[url]
+    
+    def RunUrl(self, runTime):
+        return None
+    
+    def Exists(self, url):
+        return url in self.fixtures
+    
+    def SatelliteFiles(self, url):
+        return list(self.fixtures[url])
+    
+    def Satellite(self, url, name):
+        return self.fixtures[url][name]
+
+def MakeSource(settings):
+    backend = settings.get('backend', 'remote')
+    if backend == 'mirror':
+        return MirrorSource(settings.get('mirror', '../Mirror'))
+    elif backend == 'fixtures':
+        return FixtureSource()
+    return RemoteSource()
+
+# Forecast hours the saved presets draw, which a mirror holds for every model run it syncs
+def PresetForecastHours():
+    return sorted({0} | {int(preset['delta']) for preset in config['presets']['plots'].values()})
+
+# Copies everything a map between two times could need from the home servers into the mirror.
+# Model runs are mirrored for the presets' forecast hours and any others asked for.
+def Sync(start, end, channels, fchours=()):
+    hours = sorted(set(PresetForecastHours()) | {int(fch) for fch in fchours})
+    remote = RemoteSource()
+    mirror = MirrorSource(config.get('sources', {}).get('mirror', '../Mirror'))
+    
+    def Download(url):
+        path = mirror.Path(url)
+        if not os.path.isfile(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with remote.Stream(url) as response, open(f"{path}.part", 'wb') as out:
+                out.write(response.read())
+            os.replace(f"{path}.part", path)
+    
+    step = start
+    while step <= end:
+        try:
+            if step.year < 2019:
+                Download(SourceUrl('surface_archive', time=step))
+            else:
+                Download(SourceUrl('surface_current', time=step))
+        except:
+            print(f"<sync> No surface data for {step:%Y-%m-%d %H}Z.")
+        if step.hour % 12 == 0:
+            url = SourceUrl('upper_air', time=step)
+            path = f"{mirror.Path(url)}_{step:%Y%m%d%H}.pkl"
+            try:
+                if not os.path.isfile(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    SaveFrame(remote.Soundings(url, step), path)
+            except:
+                print(f"<sync> No upper-air data for {step:%Y-%m-%d %H}Z.")
+        path = f"{mirror.Path(mirror.RunUrl(step))}.nc"
+        if (step.hour % 6 == 0) and not os.path.isfile(path):
+            opened = {}
+            parts = []
+            # NARR is an analysis, so only the run's own hour exists
+            for fch in (hours if step >= datetime(2004, 3, 2) else [0]):
+                try:
+                    if Now() - step < timedelta(days=14):
+                        url = SourceUrl('gfs_recent', run=step)
+                    elif step >= datetime(2004, 3, 2):
+                        url = ArchiveUrl(step, fch, source=remote)
+                    else:
+                        url = SourceUrl('narr', run=step)
+                    if url not in opened:
+                        opened[url] = remote.Gridded(url)
+                    parts.append(SubsetGridded(opened[url], {'box':None, 'fields':griddedFields, 'levels':mandatoryLevels, 'times':[step + timedelta(hours=fch)]}))
+                except:
+                    print(f"<sync> No gridded data for {step:%Y-%m-%d %H}Z hour {fch}.")
+            if parts:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                WriteNetcdf(xr.merge(parts, compat='no_conflicts', join='outer'), path)
+        for chan in channels:
+            url = SourceUrl('goes_catalog', sat='east', region='CONUS', chan=chan, day=step)
+            try:
+                scans = [file for file in remote.SatelliteFiles(url) if ScanTime(file) is not None]
+                if scans:
+                    # The scan a map at this time would pick is mirrored, and the mirrored listing
+                    # only names scans that are on disk, so the mirror never points elsewhere
+                    name = min(scans, key=lambda file: abs(ScanTime(file) - step))
+                    os.makedirs(os.path.dirname(mirror.Path(url)), exist_ok=True)
+                    if not os.path.isfile(f"{os.path.dirname(mirror.Path(url))}/{name}"):
+                        WriteNetcdf(remote.Satellite(url, name), f"{os.path.dirname(mirror.Path(url))}/{name}")
+                    mirrored = []
+                    if os.path.isfile(f"{mirror.Path(url)}.json"):
+                        mirrored = mirror.SatelliteFiles(url)
+                    if name not in mirrored:
+                        mirrored = sorted(mirrored + [name], key=ScanTime)
+                        with open(f"{mirror.Path(url)}.json", "w") as J:
+                            json.dump(mirrored, J)
+            except:
+                print(f"<sync> No channel {chan} satellite data for {step:%Y-%m-%d %H}Z.")
+        print(f"<sync> {step:%Y-%m-%d %H}Z mirrored.")
+        step = step + timedelta(hours=3)
+
+# Local on-disk cache for fetched data, shared by all data types and bounded by total size
+class DiskCache(object):
+    def __init__(self, name):
+        settings = config.get('cache', {})
+        self.root = settings.get('directory', '../Cache')
+        self.dir = f"{self.root}/{name}"
+        self.maxBytes = int(float(settings.get('max_mb', 4096)) * 1024**2)
+        os.makedirs(self.dir, exist_ok=True)
+
+    def Key(self, *parts):
+        return hashlib.sha1(json.dumps([str(part) for part in parts]).encode('utf-8')).hexdigest()
+
+    def Path(self, key, ext):
+        return f"{self.dir}/{key}.{ext}"
+
+    def Has(self, path):
+        if os.path.isfile(path):
+            os.utime(path) # Touching the entry marks it as recently used
+            return True
+        return False
+
+    # Least recently used entries go first once the whole cache is over its size limit. Entries
+    # live in each cache's own directory; files at the top level (the archive index) are kept.
+    def Evict(self):
+        entries = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if os.path.samefile(dirpath, self.root):
+                continue
+            for filename in filenames:
+                path = f"{dirpath}/{filename}"
+                with contextlib.suppress(OSError):
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(entry[1] for entry in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            with contextlib.suppress(OSError):
+                os.remove(path)
+                total -= size
+
+# Figuring out the data display area, padded out past the panel edges
+def DataArea(area):
+    areaZero = list(area)
+    areaScaleA = 1.1
+    areaScaleB = 0.9
+    if areaZero[0] < 0:
+        areaZero[0] = 360 + (areaZero[0] * areaScaleA)
+    if areaZero[1] < 0:
+        areaZero[1] = 360 + (areaZero[1] * areaScaleB)
+    areaZero[2] = areaZero[2] * areaScaleB
+    areaZero[3] = areaZero[3] * areaScaleA
+    latSlice = slice(areaZero[3], areaZero[2])
+    lonSlice = slice(areaZero[0], areaZero[1])
+    return latSlice, lonSlice
+
+# Index window over one axis covering a range of coordinate values, widened by the grid halo
+def HaloWindow(inside):
+    found = np.nonzero(inside)[0]
+    if found.size == 0:
+        return slice(0, inside.size)
+    return slice(max(found[0] - gridHalo, 0), min(found[-1] + gridHalo + 1, inside.size))
+
+# Index windows on a regular lat/lon grid for a data display area
+def LatLonWindow(var, box):
+    south, north = sorted((box[0].start, box[0].stop))
+    west, east = box[1].start, box[1].stop
+    lats = var['lat'].values
+    lons = var['lon'].values % 360
+    return {'lat':HaloWindow((lats >= south) & (lats <= north)), 'lon':HaloWindow((lons >= west) & (lons <= east))}
+
+# Index windows on a projected grid (NARR) for a data display area, found from the latitude and
+# longitude of every grid point, which come from the projection rather than the server
+def ProjectedWindow(ds, field, box):
+    south, north = sorted((box[0].start, box[0].stop))
+    west, east = box[1].start, box[1].stop
+    grid = ds.metpy.parse_cf(field).metpy.assign_latitude_longitude()
+    lats = grid['latitude'].values
+    lons = grid['longitude'].values % 360
+    inside = (lats >= south) & (lats <= north) & (lons >= west) & (lons <= east)
+    yAxis = grid['latitude'].dims.index('y')
+    xAxis = grid['latitude'].dims.index('x')
+    return {'y':HaloWindow(inside.any(axis=xAxis)), 'x':HaloWindow(inside.any(axis=yAxis))}
+
+# Cuts a remote dataset down to the fields, area, levels and times a map needs (every field
+# when there is no subset). Nothing is
+# transferred until the result is written, so only these hyperslabs are requested from the server.
+# A requested time or level the dataset does not have is a miss (LookupError), never a reason to
+# keep the whole axis.
+def SubsetGridded(ds, subset):
+    fields = {}
+    window = None
+    for field in (griddedFields if subset is None else subset['fields']):
+        if field not in ds:
+            continue
+        var = ds[field]
+        if subset is not None:
+            sel = {}
+            if (subset['box'] is not None) and ('lat' in var.dims) and ('lon' in var.dims):
+                var = var.isel(LatLonWindow(var, subset['box']))
+            elif (subset['box'] is not None) and ('y' in var.dims) and ('x' in var.dims):
+                if window is None:
+                    window = ProjectedWindow(ds, field, subset['box'])
+                var = var.isel(window)
+            for dim in var.dims:
+                if dim.startswith('time'):
+                    keep = np.isin(var[dim].values, np.array(subset['times'], dtype='datetime64[ns]'))
+                elif dim.startswith('isobaric'):
+                    hPa = (var[dim].values * units(var[dim].attrs.get('units', 'Pa'))).to('hPa').m
+                    keep = np.isin(np.round(hPa), subset['levels'])
+                else:
+                    continue
+                wanted = len(subset['times']) if dim.startswith('time') else len(subset['levels'])
+                if np.count_nonzero(keep) < wanted:
+                    raise LookupError(f"{field} is missing requested {dim} values")
+                sel[dim] = np.nonzero(keep)[0]
+            var = var.isel(sel)
+        fields[field] = var
+        gridMapping = var.attrs.get('grid_mapping')
+        if (gridMapping is not None) and (gridMapping in ds):
+            fields[gridMapping] = ds[gridMapping]
+    return xr.Dataset(fields)
+
+# Part file for writing a cache entry before it is renamed into place. Render workers and the
+# prefetcher can miss on the same entry at once, so each process and thread writes its own.
+def PartPath(path):
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+
+def WriteNetcdf(ds, path):
+    for var in ds.variables:
+        ds[var].encoding = {}
+    part = PartPath(path)
+    ds.to_netcdf(part)
+    os.replace(part, path)
+
+# A run that is still being published can be cached as soon as it has every time and level a
+# subset asks for, since SubsetGridded misses rather than write a partial one
+def OpenGridded(runTime, url, subset=None):
+    path = gridCache.Path(gridCache.Key(dataSource.name, runTime, url, griddedFields if subset is None else None, subset), 'nc')
+    if not gridCache.Has(path):
+        WriteNetcdf(SubsetGridded(dataSource.Gridded(url), subset), path)
+        gridCache.Evict()
+    ds = xr.open_dataset(path, chunks={} if Chunked() else None)
+    if Chunked():
+        return Working(ds.chunk(GriddedChunks(ds)))
+    return Working(ds)
+
+# Casts the floating point fields of a dataset, or a single field, to the working precision.
+# Coordinates keep theirs, since grid spacing and projections are worked out from them.
+def Working(data):
+    if isinstance(data, xr.Dataset):
+        for var in data.data_vars:
+            if np.issubdtype(data[var].dtype, np.floating) and (data[var].dtype != workingPrecision):
+                data[var] = data[var].astype(workingPrecision)
+        return data
+    if np.issubdtype(data.dtype, np.floating) and (data.dtype != workingPrecision):
+        return data.astype(workingPrecision)
+    return data
+
+# Chunked evaluation of gridded fields is opt-in, and needs dask
+def Chunked():
+    return (dask is not None) and (config.get('compute', {}).get('mode', 'eager') == 'chunked')
+
+# Chunk sizes for each time and vertical dimension of a dataset. The horizontal dimensions are
+# never split, so that finite differences always see the whole grid.
+def GriddedChunks(ds):
+    chunks = {}
+    for dim in ds.dims:
+        for prefix, size in config.get('compute', {}).get('chunks', {}).items():
+            if dim.startswith(prefix):
+                chunks[dim] = int(size)
+    return chunks
+
+# Runs the task graph behind a lazily chunked field on the configured local scheduler, keeping the
+# result in memory; anything already in memory passes straight through
+def Evaluate(field):
+    if not Chunked():
+        return field
+    settings = config.get('compute', {})
+    workers = int(settings.get('workers', 0)) or os.cpu_count()
+    return field.metpy.dequantify().persist(scheduler=settings.get('scheduler', 'threads'), num_workers=workers)
+
+# Shrinks a table of observations to compact dtypes before it is stored
+def CompactFrame(df):
+    for col in df:
+        # Text columns are object dtype, or the str dtype from pandas 3 on
+        if pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col]):
+            df[col] = df[col].astype('category')
+        elif df[col].dtype == 'float64':
+            df[col] = df[col].astype('float32')
+    return df
+
+def SaveFrame(df, path):
+    part = PartPath(path)
+    if path.endswith('.parquet'):
+        df.to_parquet(part, index=False)
+    else:
+        df.to_pickle(part)
+    os.replace(part, path)
+
+def LoadFrame(path):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+# Each archived day is downloaded once and kept as a compact Parquet file, and maps only read
+# the hour window around their time from it
+def ArchivedSurface(adjustedTime):
+    url = SourceUrl('surface_archive', time=adjustedTime)
+    if pyarrow is None:
+        return dataSource.Table(url, usecols=lambda col: col in surfaceColumns, parse_dates=['date_time'], na_values=[-9999], low_memory=False)
+    path = surfaceCache.Path(f"{adjustedTime:%Y%m%d}_metar", 'parquet')
+    if not surfaceCache.Has(path):
+        daily = dataSource.Table(url, usecols=lambda col: col in surfaceColumns, parse_dates=['date_time'], na_values=[-9999], low_memory=False)
+        SaveFrame(CompactFrame(daily), path)
+        surfaceCache.Evict()
+    window = timedelta(hours=1)
+    sfcDat = pd.read_parquet(path, filters=[('date_time', '>=', pd.Timestamp(adjustedTime - window)), ('date_time', '<=', pd.Timestamp(adjustedTime + window))])
+    if isinstance(sfcDat['station_id'].dtype, pd.CategoricalDtype):
+        sfcDat['station_id'] = sfcDat['station_id'].cat.remove_unused_categories()
+    return sfcDat
+
+# MetPy's parsers read the first few characters of what they are given to sniff for compression
+# and then seek back to the start, which a network response can't do. This keeps only what was
+# read before that one seek, and replays it ahead of the rest of the stream.
+class RewindText(object):
+    def __init__(self, stream):
+        self.stream = stream
+        self.lead = ''
+        self.rewound = False
+    
+    def read(self, size=-1):
+        if not self.rewound:
+            text = self.stream.read(size)
+            self.lead += text
+            return text
+        if (size is None) or (size < 0):
+            text, self.lead = self.lead + self.stream.read(), ''
+            return text
+        text, self.lead = self.lead[:size], self.lead[size:]
+        if len(text) < size:
+            text += self.stream.read(size - len(text))
+        return text
+    
+    def seek(self, offset, whence=0):
+        if self.rewound or (offset != 0) or (whence != 0):
+            raise UnsupportedOperation('only a single rewind to the start is supported')
+        self.rewound = True
+        return 0
+    
+    def __iter__(self):
+        if self.lead:
+            lines = (self.lead + self.stream.readline()).splitlines(True)
+            self.lead = ''
+            yield from lines
+        yield from self.stream
+    
+    def close(self):
+        self.stream.close()
+
+# Hourly bulletins are parsed once and kept by hour. The bulletin is decoded and parsed line by
+# line as it streams in. Hours that may still be receiving reports are only held in memory and
+# are refreshed after a few minutes; older hours are final and go to the disk cache.
+def RecentSurface(adjustedTime):
+    refresh = timedelta(minutes=float(config.get('cache', {}).get('sao_refresh_minutes', 15)))
+    final = (Now() - adjustedTime) > timedelta(hours=2)
+    path = surfaceCache.Path(f"{adjustedTime:%Y%m%d%H}_sao", 'parquet' if pyarrow is not None else 'pkl')
+    if final and surfaceCache.Has(path):
+        return LoadFrame(path)
+    if (adjustedTime in recentBulletins) and (datetime.utcnow() - recentBulletins[adjustedTime][0] < refresh):
+        return recentBulletins[adjustedTime][1].copy()
+    with dataSource.Stream(SourceUrl('surface_current', time=adjustedTime)) as response:
+        bulletin = RewindText(TextIOWrapper(response, encoding='utf-8', errors='backslashreplace'))
+        sfcDat = CompactFrame(metar.parse_metar_file(bulletin, year=adjustedTime.year, month=adjustedTime.month))
+    if final:
+        SaveFrame(sfcDat, path)
+        surfaceCache.Evict()
+    else:
+        recentBulletins[adjustedTime] = (datetime.utcnow(), sfcDat.copy())
+    return sfcDat
+
+def PullSurface(adjustedTime, recentness):
+    if adjustedTime.year < 2019:
+        try:
+            sfcDat = ArchivedSurface(adjustedTime)
+            sfcDat['tmpf'] = (sfcDat.air_temperature.values * units.degC).to('degF')
+            sfcDat['dwpf'] = (sfcDat.dew_point_temperature.values * units.degC).to('degF')
+            return sfcDat, 'present_weather'
+        except:
+            print("The Valpo surface data archives are down!")
+    elif recentness < timedelta(days=14):
+        try:
+            sfcDat = RecentSurface(adjustedTime)
+            sfcDat['tmpf'] = (sfcDat.air_temperature.values * units.degC).to('degF')
+            sfcDat['dwpf'] = (sfcDat.dew_point_temperature.values * units.degC).to('degF')
+            return sfcDat, 'current_wx1_symbol'
+        except:
+            print("The Valpo surface data archives are down!")
+    else:
+        print("<warning> The date you have selected has no surface data available!")
+    return None, None
+
+# Station coordinates from MetPy's station tables, built once so soundings can be joined to it
+def StationTable():
+    global stationTable
+    if stationTable is None:
+        stations = [(stid, info.latitude, info.longitude) for stid, info in station_info.items()]
+        stationTable = pd.DataFrame(stations, columns=['station', 'latitude', 'longitude']).drop_duplicates('station').set_index('station')
+    return stationTable
+
+# Each 00Z/12Z cycle is fetched once and split by mandatory level. Cycles that are still coming
+# in are only kept in memory and refetched after a while; older ones go to the disk cache.
+class SoundingStore(object):
+    def __init__(self):
+        self.cycles = {}
+    
+    def Cycle(self, cycleTime):
+        refresh = timedelta(minutes=float(config.get('cache', {}).get('sounding_refresh_minutes', 30)))
+        final = (Now() - cycleTime) > timedelta(hours=6)
+        if (cycleTime in self.cycles) and (final or (datetime.utcnow() - self.cycles[cycleTime][0] < refresh)):
+            return self.cycles[cycleTime][1], self.cycles[cycleTime][2]
+        path = soundingCache.Path(f"{cycleTime:%Y%m%d%H}_upperair", 'parquet' if pyarrow is not None else 'pkl')
+        if final and soundingCache.Has(path):
+            uaDat = LoadFrame(path)
+        else:
+            uaDat = dataSource.Soundings(SourceUrl('upper_air', time=cycleTime), cycleTime)
+            uaDat = uaDat.join(StationTable(), on='station').dropna(subset=['latitude', 'longitude'])
+            uaDat = uaDat[uaDat.station != 'KVER'] # "central Missouri" station that shouldn't be there, due to faulty lat-lon data
+            uaDat['dewpoint_depression'] = uaDat['temperature'] - uaDat['dewpoint']
+            if final:
+                SaveFrame(uaDat, path)
+                soundingCache.Evict()
+        uaLevels = {lvl: uaDat[uaDat.pressure == lvl] for lvl in mandatoryLevels}
+        self.cycles[cycleTime] = (datetime.utcnow(), uaDat, uaLevels)
+        return uaDat, uaLevels
+
+def PullUpperAir(adjustedUpperAirTime):
+    try:
+        return soundingStore.Cycle(adjustedUpperAirTime)
+    except:
+        print("<warning> The date you have selected has no upper-air data available!")
+        return None, {}
+
+# NCEI archive endpoints that may hold an old GFS run, in order of preference
+archiveTemplates = {'model-gfs-003-files':'https://www.ncei.noaa.gov/thredds/dodsC/model-gfs-003-files/{run:%Y%m/%Y%m%d}/gfs_3_{run:%Y%m%d_%H}00_{fch:03d}.grb2',
+                    'model-gfs-g3-anl-files-old':'https://www.ncei.noaa.gov/thredds/dodsC/model-gfs-g3-anl-files-old/{run:%Y%m/%Y%m%d}/gfsanl_3_{run:%Y%m%d_%H}00_000.grb',
+                    'model-gfs-003-files-old':'https://www.ncei.noaa.gov/thredds/dodsC/model-gfs-003-files-old/{run:%Y%m/%Y%m%d}/gfs_3_{run:%Y%m%d_%H}00_{fch:03d}.grb2'}
+
+# Looks up which archive serves a (cycle, forecast hour), probing every candidate at once the
+# first time and remembering the answer in the cache directory for later runs
+def ArchiveUrl(runTime, fch, refresh=False, source=None):
+    global archiveIndex
+    if source is None:
+        source = dataSource
+    path = f"{gridCache.root}/archive_index.json"
+    key = f"{runTime:%Y%m%d%H}_{fch:03d}"
+    with archiveLock:
+        if archiveIndex is None:
+            archiveIndex = {}
+            # An unreadable index only costs a fresh round of probes
+            with contextlib.suppress(OSError, ValueError):
+                with open(path, "r") as J:
+                    archiveIndex = json.load(J)
+        if refresh or (key not in archiveIndex):
+            # Analysis-only archives have no forecast hours, so they can only serve hour 0
+            candidates = {name: template.format(run=runTime, fch=fch) for name, template in archiveTemplates.items() if (fch == 0) or ('{fch' in template)}
+            pool = ThreadPoolExecutor(max_workers=len(candidates), thread_name_prefix='fetch')
+            probes = {name: pool.submit(source.Exists, url) for name, url in candidates.items()}
+            found = [name for name in candidates if probes[name].result()]
+            pool.shutdown(wait=False)
+            if not found:
+                archiveIndex.pop(key, None)
+                return None
+            archiveIndex[key] = found[0]
+            part = PartPath(path)
+            with open(part, "w") as J:
+                json.dump(archiveIndex, J)
+            os.replace(part, path)
+        return archiveTemplates[archiveIndex[key]].format(run=runTime, fch=fch)
+
+def PullGridded(adjustedGriddedTime, delta, recentness, subset):
+    url = dataSource.RunUrl(adjustedGriddedTime)
+    if url is not None:
+        try:
+            grd = OpenGridded(adjustedGriddedTime, url, subset).metpy.parse_cf()
+        except (LookupError, OSError):
+            print("<warning> The mirror does not hold the model run, times and levels you have selected!")
+            return None
+        # Runs from before the GFS archives are NARR, on its projected grid
+        if adjustedGriddedTime < datetime(2004, 3, 2):
+            grd = grd.metpy.assign_latitude_longitude()
+        return grd
+    if (recentness < timedelta(days=14)):
+        try:
+            return OpenGridded(adjustedGriddedTime, SourceUrl('gfs_recent', run=adjustedGriddedTime), subset).metpy.parse_cf()
+        except LookupError:
+            print("<warning> The model run you have selected does not have all of the times and levels requested yet!")
+            return None
+    elif (adjustedGriddedTime >= datetime(2004, 3, 2)):
+        url = ArchiveUrl(adjustedGriddedTime, delta)
+        if url is not None:
+            try:
+                return OpenGridded(adjustedGriddedTime, url, subset).metpy.parse_cf()
+            except:
+                # The index may be stale, so probe the archives again before giving up
+                url = ArchiveUrl(adjustedGriddedTime, delta, True)
+                with contextlib.suppress(Exception):
+                    if url is not None:
+                        return OpenGridded(adjustedGriddedTime, url, subset).metpy.parse_cf()
+        print("<warning> Gridded data could not be found for the date you have selected!")
+        return None
+    elif (adjustedGriddedTime >= datetime(1979, 1, 1)):
+        try:
+            return OpenGridded(adjustedGriddedTime, SourceUrl('narr', run=adjustedGriddedTime), subset).metpy.parse_cf().metpy.assign_latitude_longitude()
+        except LookupError:
+            print("<warning> Gridded data could not be found for the time and levels you have selected!")
+            return None
+    else:
+        print("<warning> The date you have selected has no gridded data available!")
+        return None
+
+# Waits on a source until its own timeout (counted from when the fetches started) runs out
+def AwaitSource(future, name, started, fallback):
+    timeout = float(config.get('timeouts', {}).get(name, 300))
+    try:
+        return future.result(timeout=max(0, started + timeout - monotonic()))
+    except FutureTimeout:
+        print(f"<warning> The {name.replace('_', '-')} data request timed out!")
+        return fallback
+
+# Shares fetched data between every frame of a job. Fetches are keyed by what they actually
+# depend on (obs hour, sounding cycle, model run), and the gridded subset covers every field,
+# level and forecast hour the job's factors need so one pull can serve all of its frames.
+class DataSession(object):
+    def __init__(self, levels, fchours, factors):
+        fields, needed = set(), set()
+        for lvl in levels:
+            lvlFields, lvlLevels = GriddedNeeds(factors, lvl if lvl == 'surface' else int(lvl))
+            fields.update(lvlFields)
+            needed.update(lvlLevels)
+        self.fields = sorted(fields)
+        self.levels = sorted(needed)
+        self.fchours = sorted({int(fch) for fch in fchours})
+        self.fetched = {}
+        self.incomplete = set()
+        self.derived = {}
+        self.smoothed = {}
     
+    # A failed pull (no data, or no data with its extras) is not kept, so the next frame tries again
+    def Fetch(self, key, pull, *args):
+        if key in self.fetched:
+            return self.fetched[key]
+        result = pull(*args)
+        if (result is not None) and not (isinstance(result, tuple) and (result[0] is None)):
+            self.fetched[key] = result
+        return result
+
 class Datum(object):
-    def __init__(self, TimeObj, delta, rewind):
+    def __init__(self, TimeObj, delta, rewind, box=None, levels=None, session=None, fields=None):
         
         time = TimeObj.time
         griddedTime = TimeObj.timeG
@@ -657,132 +1405,506 @@ class Datum(object):
         adjustedUpperAirTime = upperAirTime - timedelta(hours=rewind)
         
         self.plot_time = adjustedGriddedTime + timedelta(hours=delta)
+        times = [self.plot_time]
+        now = Now()
+        recentness = now - adjustedTime
+        if session is not None:
+            levels = session.levels
+            fields = session.fields
+            # Only a recent run's dataset holds every forecast hour; archived files hold their own
+            if recentness < timedelta(days=14):
+                times = [adjustedGriddedTime + timedelta(hours=fch) for fch in session.fchours]
+        if levels is None:
+            subset = None
+        else:
+            subset = {'box':box, 'fields':sorted(griddedFields if fields is None else fields), 'levels':sorted(levels), 'times':times}
     
-        recentness = currentTime - adjustedTime
-        if adjustedTime.year < 2019:
-            try:
-                self.sfcDat = pd.read_csv(f'http://bergeron.valpo.edu/archive_surface_data/{adjustedTime:%Y}/{adjustedTime:%Y%m%d}_metar.csv', parse_dates=['date_time'], na_values=[-9999], low_memory=False)
-                self.weather_format = 'present_weather'
-                self.sfcDat['tmpf'] = (self.sfcDat.air_temperature.values * units.degC).to('degF')
-                self.sfcDat['dwpf'] = (self.sfcDat.dew_point_temperature.values * units.degC).to('degF')
-            except:
-                print("The Valpo surface data archives are down!")
-                self.sfcDat = None
-        elif recentness < timedelta(days=14):
-            try:
-                data = StringIO(urlopen('http://bergeron.valpo.edu/current_surface_data/'f'{adjustedTime:%Y%m%d%H}_sao.wmo').read().decode('utf-8', 'backslashreplace'))
-                self.sfcDat = metar.parse_metar_file(data, year=adjustedTime.year, month=adjustedTime.month)
-                self.sfcDat['tmpf'] = (self.sfcDat.air_temperature.values * units.degC).to('degF')
-                self.sfcDat['dwpf'] = (self.sfcDat.dew_point_temperature.values * units.degC).to('degF')
-                self.weather_format = 'current_wx1_symbol'
-            except:
-                print("The Valpo surface data archives are down!")
-                self.sfcDat = None
+        if session is None:
+            session = DataSession([], [], [])
+        # Recent runs come as one dataset with every forecast hour, archived runs as one file per hour
+        frameKey = ('gridded', adjustedGriddedTime, delta, str(box))
+        if recentness < timedelta(days=14):
+            self.griddedKey = ('gridded', adjustedGriddedTime, str(box))
         else:
-            print("<warning> The date you have selected has no surface data available!")
-            self.sfcDat = None
-        try:
-            self.uaDat = IAStateUpperAir.request_all_data(adjustedUpperAirTime)
-            self.uaDat = add_station_lat_lon(self.uaDat, 'station').dropna(subset=['latitude', 'longitude'])
-            self.uaDat = self.uaDat[self.uaDat.station != 'KVER'] # "central Missouri" station that shouldn't be there, due to faulty lat-lon data
-            self.uaDat['dewpoint_depression'] = self.uaDat['temperature'] - self.uaDat['dewpoint']
-        except:
-            print("<warning> The date you have selected has no upper-air data available!")
-            self.uaDat = None
+            self.griddedKey = frameKey
+        # A run that is still being published may not have every forecast hour of the job yet. Once
+        # the job's subset has missed, each frame pulls just its own hour, so the hours that exist
+        # still render.
+        if self.griddedKey in session.incomplete:
+            self.griddedKey = frameKey
+            subset = dict(subset, times=[self.plot_time])
         
-        if (recentness < timedelta(days=14)):
-            self.grd = xr.open_dataset('https://thredds.ucar.edu/thredds/dodsC/grib'f'/NCEP/GFS/Global_onedeg/GFS_Global_onedeg_{adjustedGriddedTime:%Y%m%d}_{adjustedGriddedTime:%H%M}.grib2').metpy.parse_cf()
-        elif (adjustedGriddedTime >= datetime(2004, 3, 2)):
-            try:
-                self.grd = xr.open_dataset('https://www.ncei.noaa.gov/thredds/dodsC/model-gfs-003-files/'f'{adjustedGriddedTime:%Y%m/%Y%m%d}/gfs_3_{adjustedGriddedTime:%Y%m%d_%H}00_{delta:03d}.grb2').metpy.parse_cf()
-            except:
-                try:
-                    self.grd = xr.open_dataset('https://www.ncei.noaa.gov/thredds/dodsC/model-gfs-g3-anl-files-old/'f'{adjustedGriddedTime:%Y%m/%Y%m%d}/gfsanl_3_{adjustedGriddedTime:%Y%m%d_%H}00_000.grb').metpy.parse_cf()
-                except:
-                    try:
-                        self.grd = xr.open_dataset('https://www.ncei.noaa.gov/thredds/dodsC/model-gfs-003-files-old/'f'{adjustedGriddedTime:%Y%m/%Y%m%d}/gfs_3_{adjustedGriddedTime:%Y%m%d_%H}00_{delta:03d}.grb2').metpy.parse_cf()
-                    except:
-                        print("<warning> Gridded data could not be found for the date you have selected!")
-                        self.grd = None
-        elif (adjustedGriddedTime >= datetime(1979, 1, 1)):
-            self.grd = xr.open_dataset('https://www.ncei.noaa.gov/thredds/dodsC/model-narr-a-files/'f'{adjustedGriddedTime:%Y%m/%Y%m%d}/narr-a_221_{adjustedGriddedTime:%Y%m%d_%H}00_000.grb').metpy.parse_cf().metpy.assign_latitude_longitude()
+        # The three sources are independent, so they are all fetched at once
+        pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix='fetch')
+        started = monotonic()
+        surface = pool.submit(AtTime, now, session.Fetch, ('surface', adjustedTime), PullSurface, adjustedTime, recentness)
+        upperAir = pool.submit(AtTime, now, session.Fetch, ('upper_air', adjustedUpperAirTime), PullUpperAir, adjustedUpperAirTime)
+        # Maps with no gridded factors skip the model data altogether
+        if (subset is None) or subset['fields']:
+            gridded = pool.submit(AtTime, now, session.Fetch, self.griddedKey, PullGridded, adjustedGriddedTime, delta, recentness, subset)
         else:
-            print("<warning> The date you have selected has no gridded data available!")
-            self.grd = None
+            gridded = None
+        try:
+            self.sfcDat, self.weather_format = AwaitSource(surface, 'surface', started, (None, None))
+            self.uaDat, self.uaLevels = AwaitSource(upperAir, 'upper_air', started, (None, {}))
+            self.grd = AwaitSource(gridded, 'gridded', started, None) if gridded is not None else None
+            if (self.grd is None) and (gridded is not None) and (subset is not None) and (len(subset['times']) > 1):
+                session.incomplete.add(self.griddedKey)
+                self.griddedKey = frameKey
+                gridded = pool.submit(AtTime, now, session.Fetch, frameKey, PullGridded, adjustedGriddedTime, delta, recentness, dict(subset, times=[self.plot_time]))
+                self.grd = AwaitSource(gridded, 'gridded', started, None)
+        finally:
+            pool.shutdown(wait=False)
+        
+        # Each frame adds its own derived fields, so it gets its own view of the shared dataset
+        if self.grd is not None:
+            self.grd = self.grd.copy()
             
             
-def PullData(time, delta, rewnd):
-    return Datum(time, delta, rewnd)
+def PullData(time, delta, rewnd, box=None, levels=None, session=None, fields=None):
+    return Datum(time, delta, rewnd, box, levels, session, fields)
+
+# Scan start times of every file in one day's GOES catalog, kept sorted so the nearest scan to a
+# time is a binary search. Past days never change and are kept on disk; the current day is
+# re-listed once a request asks for a time past its newest scan, and only new names are parsed.
+class SatIndex(object):
+    def __init__(self, sat, region, chan, day):
+        self.url = SourceUrl('goes_catalog', sat=sat, region=region, chan=chan, day=day)
+        self.path = satCache.Path(f"{sat}_{region}_{chan:02d}_{day:%Y%m%d}_index", 'json')
+        self.final = day.date() < Now().date()
+        self.names = []
+        self.times = np.array([], dtype='datetime64[m]')
+        self.checked = None
+        if self.final and satCache.Has(self.path):
+            # An index that can't be read is built again from the catalog
+            try:
+                with open(self.path, "r") as J:
+                    self.names = json.load(J)
+                self.times = np.array([ScanTime(name) for name in self.names], dtype='datetime64[m]')
+            except (OSError, ValueError):
+                self.names = []
+                self.times = np.array([], dtype='datetime64[m]')
+                self.Refresh()
+        else:
+            self.Refresh()
+    
+    def Refresh(self):
+        known = set(self.names)
+        names = list(self.names)
+        times = list(self.times)
+        for file in dataSource.SatelliteFiles(self.url):
+            if file not in known:
+                scan = ScanTime(file)
+                if scan is not None:
+                    names.append(file)
+                    times.append(np.datetime64(scan, 'm'))
+        order = np.argsort(np.array(times, dtype='datetime64[m]'), kind='stable')
+        self.names = [names[i] for i in order]
+        self.times = np.array(times, dtype='datetime64[m]')[order]
+        self.checked = datetime.utcnow()
+        if self.final:
+            part = PartPath(self.path)
+            with open(part, "w") as J:
+                json.dump(self.names, J)
+            os.replace(part, self.path)
+            satCache.Evict()
+    
+    def Nearest(self, time):
+        target = np.datetime64(time, 'm')
+        recheck = timedelta(minutes=float(config.get('cache', {}).get('catalog_refresh_minutes', 2)))
+        if (not self.final) and ((len(self.times) == 0) or (target > self.times[-1])) and (datetime.utcnow() - self.checked > recheck):
+            self.Refresh()
+        i = np.searchsorted(self.times, target)
+        candidates = [j for j in (i - 1, i) if 0 <= j < len(self.times)]
+        return self.names[min(candidates, key=lambda j: abs(self.times[j] - target))]
+
+def ScanTime(file):
+    try:
+        return datetime.strptime(file.split('_')[3][1:-3], '%Y%j%H%M')
+    except (IndexError, ValueError):
+        return None
+
+def SatelliteIndex(sat, region, chan, day):
+    key = (sat, region, chan, f"{day:%Y%m%d}")
+    if key not in satIndexes:
+        satIndexes[key] = SatIndex(sat, region, chan, day)
+    return satIndexes[key]
+
+# Finds the x/y index window of a satellite image that covers a lon/lat box, by tracing the
+# box edges into the image's own projection. Nothing but coordinates is read to do this.
+def SatWindow(dat, area, pad=10):
+    cmi = dat.metpy.parse_cf('Sectorized_CMI')
+    crs = cmi.metpy.cartopy_crs
+    west, east, south, north = area
+    edge = np.linspace(0, 1, 50)
+    lons = np.concatenate([west + (east - west) * edge, np.full(50, east), east + (west - east) * edge, np.full(50, west)])
+    lats = np.concatenate([np.full(50, south), south + (north - south) * edge, np.full(50, north), north + (south - north) * edge])
+    points = crs.transform_points(ccrs.PlateCarree(), lons, lats)
+    points = points[np.isfinite(points[:, 0]) & np.isfinite(points[:, 1])]
+    window = {}
+    for coord, projected in ((cmi.metpy.x, points[:, 0]), (cmi.metpy.y, points[:, 1])):
+        unit = coord.attrs.get('units', 'm')
+        if 'rad' in unit:
+            # GOES fixed grid coordinates are scan angles
+            values = coord.values * crs.proj4_params['h']
+        else:
+            values = (coord.values * units(unit)).to('m').m
+        inside = np.nonzero((values >= projected.min()) & (values <= projected.max()))[0]
+        if len(inside) == 0:
+            return None
+        window[coord.name] = slice(max(inside.min() - pad, 0), inside.max() + pad + 1)
+    return window
+
+# Processed satellite frames keyed by (satellite, region, channel, scan, window, enhancement), kept
+# in memory and on disk. Both are bounded by a number of frames and drop the oldest scans first,
+# so a loop that slides forward only has to fetch its newest frame.
+class FrameCache(object):
+    def __init__(self):
+        settings = config.get('cache', {})
+        self.memoryLimit = int(settings.get('sat_memory_frames', 24))
+        self.diskLimit = int(settings.get('sat_disk_frames', 240))
+        self.dir = f"{satCache.dir}/frames"
+        self.frames = {}
+        os.makedirs(self.dir, exist_ok=True)
+    
+    def Path(self, key, scan):
+        return f"{self.dir}/{scan:%Y%m%d%H%M}_{satCache.Key(*key)}.nc"
+    
+    def Get(self, key, scan):
+        if key in self.frames:
+            return self.frames[key][1]
+        path = self.Path(key, scan)
+        if os.path.isfile(path):
+            frame = xr.load_dataset(path)
+            self.Keep(key, scan, frame)
+            return frame
+        return None
+    
+    def Put(self, key, scan, frame):
+        WriteNetcdf(frame.copy(), self.Path(key, scan))
+        self.Keep(key, scan, frame)
+        # Frame files are named by scan time, so the oldest sort first
+        stored = sorted(os.listdir(self.dir))
+        for old in stored[:max(len(stored) - self.diskLimit, 0)]:
+            with contextlib.suppress(OSError):
+                os.remove(f"{self.dir}/{old}")
+    
+    def Keep(self, key, scan, frame):
+        self.frames[key] = (scan, frame)
+        while len(self.frames) > self.memoryLimit:
+            del self.frames[min(self.frames, key=lambda k: self.frames[k][0])]
 
 class SatDat(object):
-    def __init__(self, sat, chan, time, region):
-        catalog = TDSCatalog(f'https://thredds.ucar.edu/thredds/catalog/satellite/goes/{sat}/products/CloudAndMoistureImagery/{region}/Channel{chan:02d}/{time:%Y%m%d}/catalog.xml')
-        sateliteFormatHour = time.strftime('%Y%j%H')
-        files = []
-        times = []
-        for file in catalog.datasets:
-            if sateliteFormatHour in file:
-                times.append(datetime.strptime(file.split('_')[3][1:-3], '%Y%j%H%M'))
-                files.append(file)
-        fileSearch = np.abs(np.array(times) - time)
-        index = list(catalog.datasets).index(files[np.argmin(fileSearch)])
-        self.dat = catalog.datasets[index].remote_access(use_xarray=True)
-        if chan == 2:
-            self.dat['Sectorized_CMI'].values = np.sqrt(self.dat['Sectorized_CMI'].values)
+    def __init__(self, sat, chan, time, region, area=None, enhance=True):
+        index = SatelliteIndex(sat, region, chan, time)
+        name = index.Nearest(time)
+        scan = ScanTime(name)
+        key = (sat, region, chan, name, area, (chan == 2) and enhance)
+        self.dat = satFrames.Get(key, scan)
+        if self.dat is None:
+            remote = dataSource.Satellite(index.url, name)
+            gridMapping = remote['Sectorized_CMI'].attrs.get('grid_mapping')
+            self.dat = remote[[var for var in ('Sectorized_CMI', gridMapping) if var in remote]]
+            # Only the part of the sector under the panel is fetched and processed
+            if isinstance(area, tuple):
+                window = SatWindow(self.dat, area)
+                if window is not None:
+                    self.dat = self.dat.isel(window)
+            self.dat = Working(self.dat.load())
+            if (chan == 2) and enhance:
+                self.dat['Sectorized_CMI'].values = np.sqrt(self.dat['Sectorized_CMI'].values)
+            satFrames.Put(key, scan, self.dat)
+        self.dat = Working(self.dat)
         self.dtm = self.dat.time.values.astype('datetime64[ms]').astype('O')
         
-def PullSatData(sat, chan, time, region):
-    return SatDat(sat, chan, time, region)
+def PullSatData(sat, chan, time, region, area=None, enhance=True):
+    return SatDat(sat, chan, time, region, area, enhance)
+
+# Averages 2x2 blocks of a half-kilometre channel down to the one-kilometre grid. Blocks start at
+# whichever pixel lines pairs up with the one-kilometre pixel centres.
+def HalfResolution(fine, coarse):
+    yDim, xDim = fine.dims
+    offsets = {}
+    for dim in (yDim, xDim):
+        mid = (fine[dim].values[0] + fine[dim].values[1]) / 2
+        step = abs(fine[dim].values[1] - fine[dim].values[0])
+        offsets[dim] = 0 if np.min(np.abs(coarse[dim].values - mid)) < step / 2 else 1
+    fine = fine.isel({yDim:slice(offsets[yDim], None), xDim:slice(offsets[xDim], None)})
+    h = fine.shape[0] // 2 * 2
+    w = fine.shape[1] // 2 * 2
+    blocks = fine.values[:h, :w].astype('float32').reshape(h // 2, 2, w // 2, 2).mean(axis=(1, 3))
+    return xr.DataArray(blocks, dims=(yDim, xDim), coords={yDim:fine[yDim].values[:h].reshape(-1, 2).mean(axis=1), xDim:fine[xDim].values[:w].reshape(-1, 2).mean(axis=1)})
 
+# Puts a channel on the blue channel's grid; pixels the channel does not cover come out empty
+def OnGrid(channel, grid):
+    yDim, xDim = grid.dims
+    step = abs(float(grid[xDim].values[1] - grid[xDim].values[0]))
+    return channel.reindex({yDim:grid[yDim].values, xDim:grid[xDim].values}, method='nearest', tolerance=step / 2).values.astype('float32')
+
+# Builds one RGB image from channels 1 (blue), 2 (red) and 3 (veggie). All the work happens in
+# place in float32, and the result is a single uint8 array that one ImagePlot draws.
 class TruecolorSat(object):
     def __init__(self, B, R, Veg):
-        B_dat = np.power(np.clip(B.dat["Sectorized_CMI"].data, 0, 1), 1/2.2)
-        R_dat = np.power(np.clip(R.dat["Sectorized_CMI"].data[::2,::2], 0, 1), 1/2.2)
-        Veg_dat = np.power(np.clip(Veg.dat["Sectorized_CMI"].data, 0, 1), 1/2.2)
+        blue = B.dat["Sectorized_CMI"]
         
-        G_dat = (R_dat * 0.45) + (Veg_dat * 0.1) + (B_dat * 0.45)
-        G_dat = np.clip(G_dat, 0, 1)
+        B_dat = blue.values.astype('float32')
+        R_dat = OnGrid(HalfResolution(R.dat["Sectorized_CMI"], blue), blue)
+        Veg_dat = OnGrid(Veg.dat["Sectorized_CMI"], blue)
+        for arr in (B_dat, R_dat, Veg_dat):
+            np.nan_to_num(arr, copy=False)
+            np.clip(arr, 0, 1, out=arr)
+            np.power(arr, 1/2.2, out=arr)
         
-        ArrRed = B
-        ArrGrn = B
-        ArrBlu = B
+        # G = 0.45 R + 0.1 Veg + 0.45 B, built up in the veggie array
+        G_dat = Veg_dat
+        G_dat *= 0.1 / 0.45
+        G_dat += R_dat
+        G_dat += B_dat
+        G_dat *= 0.45
+        np.clip(G_dat, 0, 1, out=G_dat)
         
-        ArrRed.dat["Sectorized_CMI"].data = R_dat / 255
-        ArrGrn.dat["Sectorized_CMI"].data = G_dat / 255
-        ArrBlu.dat["Sectorized_CMI"].data = B_dat / 255
+        rgb = np.empty(blue.shape + (3,), dtype='uint8')
+        for band, arr in enumerate((R_dat, G_dat, B_dat)):
+            arr *= 255
+            arr += 0.5
+            rgb[..., band] = arr
         
-        self.rdat = ArrRed.dat
-        self.gdat = ArrGrn.dat
-        self.bdat = ArrBlu.dat
+        attrs = {}
+        self.dat = xr.Dataset(coords={dim: blue[dim] for dim in blue.dims})
+        gridMapping = blue.attrs.get('grid_mapping')
+        if gridMapping is not None:
+            attrs['grid_mapping'] = gridMapping
+            self.dat[gridMapping] = B.dat[gridMapping]
+        self.dat['Truecolor_RGB'] = ((blue.dims[0], blue.dims[1], 'rgb'), rgb, attrs)
+        self.dtm = B.dtm
         
-        #TrueGreen.dat["Sectorized_CMI"].data = np.dstack([R_dat, G_dat, B_dat])
-        #self.dat = TrueGreen.dat
-        #self.dtm = TrueGreen.dtm
+# Map from every pixel of the map's image grid to the satellite pixel under it (-1 where there is
+# none). It depends only on the geometry, so it is worked out once and kept on disk.
+def ResampleMap(srcCrs, xs, ys, dstCrs, extent, width, height):
+    key = satCache.Key(srcCrs.proj4_init, xs[0], xs[-1], len(xs), ys[0], ys[-1], len(ys), dstCrs.proj4_init, [round(edge, 3) for edge in extent], width, height)
+    path = satCache.Path(key, 'npy')
+    if satCache.Has(path):
+        return np.load(path)
+    targetX = extent[0] + (np.arange(width) + 0.5) * (extent[1] - extent[0]) / width
+    targetY = extent[3] - (np.arange(height) + 0.5) * (extent[3] - extent[2]) / height
+    gridX, gridY = np.meshgrid(targetX, targetY)
+    points = srcCrs.transform_points(dstCrs, gridX.ravel(), gridY.ravel())
+    col = np.rint((points[:, 0] - xs[0]) / (xs[1] - xs[0]))
+    row = np.rint((points[:, 1] - ys[0]) / (ys[1] - ys[0]))
+    valid = np.isfinite(col) & np.isfinite(row) & (col >= 0) & (col < len(xs)) & (row >= 0) & (row < len(ys))
+    gather = np.full(width * height, -1, dtype='int32')
+    gather[valid] = (row[valid] * len(xs) + col[valid]).astype('int32')
+    gather = gather.reshape(height, width)
+    part = PartPath(path)
+    with open(part, 'wb') as out:
+        np.save(out, gather)
+    os.replace(part, path)
+    satCache.Evict()
+    return gather
+
+# ImagePlot that puts satellite pixels straight onto the map's own pixel grid with a cached
+# gather, instead of having Cartopy warp the image into the map projection on every draw
+class ResampledImagePlot(declarative.ImagePlot):
+    resolution = Int(100)
+    resolution.__doc__ = """Pixels per inch of the resampled image, normally the map DPI."""
+    
+    def _build(self):
+        x_like, y_like, imdata = self.plotdata
+        ax = self.parent.ax
+        extent = ax.get_extent()
+        box = ax.get_position()
+        width = max(int(box.width * ax.figure.get_figwidth() * self.resolution), 1)
+        height = max(int(box.height * ax.figure.get_figheight() * self.resolution), 1)
+        gather = ResampleMap(imdata.metpy.cartopy_crs, np.asarray(x_like), np.asarray(y_like), ax.projection, extent, width, height)
         
+        pixels = imdata.values.reshape((-1,) + imdata.shape[2:])[np.maximum(gather, 0)]
+        missing = gather < 0
+        if pixels.ndim == 3:
+            # RGB images get an alpha band so pixels off the image stay clear
+            alpha = np.where(missing, 0, 255).astype('uint8')
+            pixels = np.dstack([pixels.astype('uint8'), alpha])
+            self.handle = ax.imshow(pixels, extent=extent, origin='upper', transform=ax.projection, interpolation='nearest')
+        else:
+            pixels = np.ma.masked_array(pixels, missing)
+            self.handle = ax.imshow(pixels, extent=extent, origin='upper', transform=ax.projection, interpolation='nearest', cmap=self._cmap_obj, norm=self._norm_obj)
+
+# Draws static map layers alone, once per map geometry, to a transparent raster in the cache. The
+# layers are styled the way MapPanel draws them by default.
+def BaseMapRaster(features, projection, extent, width, height, dpi):
+    key = baseCache.Key(features, projection.proj4_init, [round(edge, 3) for edge in extent], width, height, dpi)
+    path = baseCache.Path(key, 'png')
+    if not baseCache.Has(path):
+        fig = plt.figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+        ax = fig.add_axes([0, 0, 1, 1], projection=projection)
+        ax.set_extent(extent, crs=projection)
+        ax.spines['geo'].set_visible(False)
+        ax.patch.set_visible(False)
+        for feature in features:
+            ax.add_feature(declarative.lookup_map_feature(feature), edgecolor='black', linewidth=1)
+        part = PartPath(path)
+        fig.savefig(part, format='png', dpi=dpi, transparent=True)
+        plt.close(fig)
+        os.replace(part, path)
+        baseCache.Evict()
+    return plt.imread(path)
+
+# Lays the cached raster of the static map layers over the panel, at the height in the stack that
+# Cartopy gives map features, so it sits over fills and under contours and barbs as before
+class BaseMapPlot(declarative.Plots2D):
+    features = List(Unicode(), default_value=['states', 'coastline', 'borders'])
+    features.__doc__ = """Names of the map layers in the raster, as MapPanel.layers takes them."""
+    
+    resolution = Int(100)
+    resolution.__doc__ = """Pixels per inch of the raster, normally the map DPI."""
+    
+    @property
+    def name(self):
+        return ', '.join(self.features)
+    
+    def draw(self):
+        if getattr(self, 'handle', None) is None:
+            self._build()
+    
+    def _build(self):
+        ax = self.parent.ax
+        extent = ax.get_extent()
+        box = ax.get_position()
+        width = max(int(box.width * ax.figure.get_figwidth() * self.resolution), 1)
+        height = max(int(box.height * ax.figure.get_figheight() * self.resolution), 1)
+        raster = BaseMapRaster(list(self.features), ax.projection, extent, width, height, self.resolution)
+        self.handle = ax.imshow(raster, extent=extent, origin='upper', transform=ax.projection, interpolation='nearest', zorder=1.5)
+
 def MakeTruecolorSat(B, R, Veg):
     return TruecolorSat(B, R, Veg)  
 
-def GriddedCalculations(Data, level):
+# Raw model fields by what they hold, as (surface map field, upper-air map field)
+rawFields = {'temperature': ('Temperature_height_above_ground', 'Temperature_isobaric'),
+             'u': ('u-component_of_wind_height_above_ground', 'u-component_of_wind_isobaric'),
+             'v': ('v-component_of_wind_height_above_ground', 'v-component_of_wind_isobaric'),
+             'dewpoint': ('Dewpoint_temperature_height_above_ground', None),
+             'relative_humidity': (None, 'Relative_humidity_isobaric'),
+             'mslp': ('Pressure_reduced_to_MSL_msl', None),
+             'height': ('Geopotential_height_isobaric', 'Geopotential_height_isobaric'),
+             'absolute_vorticity': (None, 'Absolute_vorticity_isobaric')}
+
+# Heights of the fields above ground on surface maps
+surfaceHeights = {'temperature': 2*units.m, 'u': 10*units.m, 'v': 10*units.m, 'dewpoint': 2*units.m}
+
+# Derived gridded fields, as (inputs, calculation). Inputs are raw or derived fields at the map's
+# level, or at a fixed level with 'name@hPa'. Calculations run on whole blocks of the data, every
+# time and level at once.
+derivedFields = {'wind_speed': (['u', 'v'], lambda f: mpcalc.wind_speed(f.Block('u'), f.Block('v'))),
+                 'relative_vorticity': (['u', 'v'], lambda f: mpcalc.vorticity(f.Block('u'), f.Block('v'))),
+                 'temperature_advection': (['temperature', 'u', 'v'], lambda f: mpcalc.advection(f.Block('temperature'), f.Block('u'), f.Block('v'))),
+                 'thickness_500_1000': (['height@500', 'height@1000'], lambda f: (f.Block('height@500').metpy.quantify() - f.Block('height@1000').metpy.quantify()).metpy.dequantify()),
+                 'dewpoint': (['temperature', 'relative_humidity'], lambda f: mpcalc.dewpoint_from_relative_humidity(f.Block('temperature'), f.Block('relative_humidity'))),
+                 'dewpoint_depression': (['temperature', 'dewpoint'], lambda f: (f.Block('temperature').metpy.convert_units('degC').metpy.quantify() - f.Block('dewpoint').metpy.convert_units('degC').metpy.quantify()).metpy.dequantify()),
+                 'mixing_ratio': (['dewpoint'], lambda f: mpcalc.mixing_ratio(mpcalc.saturation_vapor_pressure(f.Block('dewpoint')), f.Block('dewpoint')['isobaric']))}
+
+# The gridded fields each factor draws, as (on surface maps, on upper-air maps)
+factorFields = {'temp_fill': (['temperature'], ['temperature']),
+                'temp_contours': (['temperature'], ['temperature']),
+                'dew_contours': (['dewpoint'], ['dewpoint']),
+                'dewpoint_depression_fill': (['dewpoint_depression'], ['dewpoint_depression']),
+                'mixing_ratio_contours': ([], ['mixing_ratio']),
+                'pressure_contours': (['mslp'], []),
+                'height_contours': ([], ['height']),
+                'absolute_vorticity_fill': ([], ['absolute_vorticity']),
+                'gridded_barbs': (['u', 'v'], ['u', 'v']),
+                'wind_speed_fill': (['wind_speed'], ['wind_speed']),
+                'temp_advect_fill': (['temperature_advection'], ['temperature_advection']),
+                'relative_vorticity_fill': (['relative_vorticity'], ['relative_vorticity']),
+                'thickness_500_1000': (['thickness_500_1000'], ['thickness_500_1000'])}
+
+def FieldKind(level):
+    return 0 if level == 'surface' else 1
+
+def IsDerived(name, level):
+    base = name.partition('@')[0]
+    return (base in derivedFields) and (rawFields.get(base, (None, None))[FieldKind(level)] is None)
+
+# Walks the inputs of every field a map's factors draw, down to the raw model fields, and gives the
+# fields and isobaric levels that have to be pulled for it
+def GriddedNeeds(factors, level):
+    fields, levels = set(), set()
+    def Visit(name):
+        base, _, fixed = name.partition('@')
+        if IsDerived(base, level):
+            for need in derivedFields[base][0]:
+                Visit(need)
+            return
+        field = rawFields[base][FieldKind(level)]
+        fields.add(field)
+        if field.endswith('isobaric'):
+            levels.add(int(fixed) if fixed else level)
+    for factor in factors:
+        for name in factorFields.get(factor, ([], []))[FieldKind(level)]:
+            Visit(name)
+    return sorted(fields), sorted(levels)
+
+# The derived fields a map's factors plot directly
+def FactorDerived(factors, level):
+    return [name for factor in factors for name in factorFields.get(factor, ([], []))[FieldKind(level)] if IsDerived(name, level)]
+
+# Works out gridded fields for a job on demand. Each field is worked out once per model run over
+# the whole (time, vertical, y, x) block the job pulled, and kept in the job's session; every frame
+# then only slices its own time and level out of the block. Plotted fields are also kept on disk by
+# model run, valid time, level and area, so later runs of the same map skip the work entirely.
+class DerivedFields(object):
+    def __init__(self, Data, level, session=None):
+        self.Data = Data
+        self.level = level
+        self.memo = session.derived if session is not None else {}
+        
+    # Fields are only ever worked out from a complete subset (see OpenGridded), so like the subset
+    # they are cached whether or not the run is still being published
+    def Get(self, name):
+        path = derivedCache.Path(derivedCache.Key(dataSource.name, self.Data.griddedKey, self.Data.plot_time, self.level, name, workingPrecision), 'nc')
+        if derivedCache.Has(path):
+            with xr.open_dataset(path) as stored:
+                return self.Plain(stored[name].load())
+        field = self.Plain(self.Slice(name))
+        WriteNetcdf(field.metpy.dequantify().drop_vars('metpy_crs', errors='ignore').to_dataset(name=name), path)
+        derivedCache.Evict()
+        return field
     
-    plot_time = Data.plot_time
+    # Only the 2D field goes into the map's dataset. Its scalar time and level coordinates would
+    # otherwise be attached to every variable there.
+    def Plain(self, field):
+        return field.drop_vars([coord for coord in field.coords if (field[coord].ndim == 0) and (coord != 'metpy_crs')])
     
-    if level == 'surface':
-        tmpk = Data.grd.Temperature_height_above_ground.metpy.sel(vertical=2*units.m, time=plot_time)
-        uwind = Data.grd['u-component_of_wind_height_above_ground'].metpy.sel(vertical=10*units.m, time=plot_time)
-        vwind = Data.grd['v-component_of_wind_height_above_ground'].metpy.sel(vertical=10*units.m, time=plot_time)
-        Data.grd['wind_speed_height_above_ground'] = mpcalc.wind_speed(uwind, vwind)
-    else:
-        tmpk = Data.grd.Temperature_isobaric.metpy.sel(vertical=level*units.hPa, time=plot_time)
-        uwind = Data.grd['u-component_of_wind_isobaric'].metpy.sel(vertical=level*units.hPa, time=plot_time)
-        vwind = Data.grd['v-component_of_wind_isobaric'].metpy.sel(vertical=level*units.hPa, time=plot_time)
-        Data.grd['wind_speed_isobaric'] = mpcalc.wind_speed(uwind, vwind)
-    Data.grd['relative_vorticity'] = mpcalc.vorticity(uwind, vwind)
-    Data.grd['temperature_advection'] = mpcalc.advection(tmpk, uwind, vwind)
-    hght_500 = Data.grd.Geopotential_height_isobaric.metpy.sel(time=plot_time, vertical=500 * units.hPa).metpy.quantify()
-    hght_1000 = Data.grd.Geopotential_height_isobaric.metpy.sel(time=plot_time, vertical=1000 * units.hPa).metpy.quantify()
-    Data.grd['thickness_500_1000'] = (hght_500 - hght_1000).metpy.dequantify()
-    
-    return Data
+    def Slice(self, name):
+        block = self.Block(name)
+        if 'isobaric' in block.dims:
+            return block.metpy.sel(vertical=self.level * units.hPa, time=self.Data.plot_time)
+        else:
+            return block.metpy.sel(time=self.Data.plot_time)
+    
+    def Block(self, name):
+        key = (self.Data.griddedKey, FieldKind(self.level), name)
+        if key not in self.memo:
+            if IsDerived(name, self.level):
+                self.memo[key] = Evaluate(Working(derivedFields[name][1](self)))
+            else:
+                self.memo[key] = self.Raw(name)
+        return self.memo[key]
+    
+    # Raw fields come with their time and vertical dimensions under one name each, so that blocks
+    # from different fields line up with each other
+    def Raw(self, name):
+        base, _, fixed = name.partition('@')
+        var = self.Data.grd[rawFields[base][FieldKind(self.level)]]
+        if fixed:
+            var = var.metpy.sel(vertical=int(fixed) * units.hPa)
+        elif (self.level == 'surface') and (base in surfaceHeights):
+            var = var.metpy.sel(vertical=surfaceHeights[base])
+        dims = {}
+        for dim in var.dims:
+            if dim.startswith('time') and (dim != 'time'):
+                dims[dim] = 'time'
+            elif dim.startswith('isobaric') and (dim != 'isobaric'):
+                dims[dim] = 'isobaric'
+        return var.rename(dims)
 
 def ClearTemp():
     for subPath in os.listdir(f"../Maps/Temp"):
@@ -793,10 +1915,120 @@ def ClearTemp():
             with contextlib.suppress(FileNotFoundError):
                 os.remove(f"../Maps/Temp/{subPath}")
     
+# Parse custom zoom feature
+def PanelArea(area):
+    simArea = area.replace("+", "")
+    simArea = simArea.replace("-", "")
+    if simArea in area_dictionary:
+        splitArea = Counter(area)
+        factor = (splitArea['+']) - (splitArea['-'])
+        scaleFactor = (1 - 2**-factor)/2
+        west, east, south, north = area_dictionary[f'{simArea}']
+        newWest = west - (west - east) * scaleFactor
+        newEast = east + (west - east) * scaleFactor
+        newSouth = south - (south - north) * scaleFactor
+        newNorth = north + (south - north) * scaleFactor
+        return newWest, newEast, newSouth, newNorth
+    else:
+        return f'{area}'
+
+# Smoothing kernels for contour fields, by the name presets use. Each takes a 2D field and the
+# preset's smoothing strength; 'zoom' is the spline interpolation MetPy's smooth_contour does.
+smoothingKernels = {'zoom': lambda field, n: mpcalc.zoom_xarray(field, n),
+                    'gaussian': lambda field, n: mpcalc.smooth_gaussian(field, n),
+                    'n-point': lambda field, n: mpcalc.smooth_n_point(field, 9, n)}
+
+# Contour fields smoothed once per field, level, time and kernel, and shared by every layer and
+# frame of a job that draws them. Derived fields are already cut to the map's level and time, so
+# the map level is part of the key as well as the layer's own selection.
+def SmoothedField(Data, mapLevel, field, level, time, smoothing, kernel, session=None):
+    memo = session.smoothed if session is not None else {}
+    key = (Data.griddedKey, Data.plot_time, str(mapLevel), field, str(level), str(time), smoothing, kernel)
+    if key not in memo:
+        var = Data.grd[field]
+        if level is not None:
+            var = var.metpy.sel(vertical=level)
+        if time is not None:
+            var = var.metpy.sel(time=time)
+        smoothed = smoothingKernels[kernel](var, smoothing).to_dataset(name=field)
+        # The grid mapping variable comes along, so MetPy still finds the field's projection
+        gridMapping = var.attrs.get('grid_mapping')
+        if (gridMapping is not None) and (gridMapping in Data.grd):
+            smoothed[gridMapping] = Data.grd[gridMapping]
+        memo[key] = smoothed
+    return memo[key]
+
+# Points a contour layer at the shared smoothed copy of its field
+def SmoothLayer(layer, Data, values, session=None):
+    smoothing = int(values['smoothing'])
+    if smoothing > 0:
+        layer.data = SmoothedField(Data, values['level'], layer.field, layer.level, layer.time, smoothing, values.get('kernel', 'zoom'), session)
+        layer.level = None
+        layer.time = None
+
+# Background worker that watches the clock, and once a new obs hour or model cycle should be out,
+# pulls what every saved 'recent' preset needs into the caches
+def PrefetchWorker():
+    lastCycle = None
+    while not prefetchStop.is_set():
+        clock.now = datetime.utcnow()
+        cycle = ParseTime('recent')
+        # A cycle is only done once every preset got its model data. Until the run has the hours a
+        # preset asks for, its subset misses (LookupError) and the cycle is tried again next time.
+        if (cycle.time, cycle.timeUA, cycle.timeG) != lastCycle:
+            warmed = True
+            for preset in list(config['presets']['plots'].values()):
+                if preset['date'] != 'recent':
+                    continue
+                level = preset['level'] if preset['level'] == 'surface' else int(preset['level'])
+                fields, levels = GriddedNeeds(preset['factors'].split(", "), level)
+                try:
+                    datum = PullData(cycle, int(preset['delta']), 0, DataArea(PanelArea(preset['area'])), levels, None, fields)
+                    if fields and (datum.grd is None):
+                        warmed = False
+                except Exception:
+                    warmed = False
+            if warmed:
+                lastCycle = (cycle.time, cycle.timeUA, cycle.timeG)
+        prefetchStop.wait(float(config.get('prefetch', {}).get('interval', 300)))
+
+# Draws the map at float64 and at the working precision, and reports for each contour layer how
+# many grid points land in a different contour interval
+def PrecisionCheck(values):
+    global workingPrecision
+    policy = workingPrecision
+    layers = {}
+    try:
+        for dtype in (np.dtype('float64'), policy):
+            workingPrecision = dtype
+            product = run(dict(values), '')
+            layers[dtype] = [plot for plot in product['panel'].plots if isinstance(plot, (declarative.ContourPlot, declarative.FilledContourPlot))]
+    finally:
+        workingPrecision = policy
+    tolerance = float(config.get('compute', {}).get('precision_tolerance', 0.001))
+    for wide, narrow in zip(layers[np.dtype('float64')], layers[policy]):
+        contours = np.asarray(wide.contours, dtype='float64')
+        wideBins = np.digitize(wide.griddata.metpy.dequantify().values.astype('float64'), contours)
+        narrowBins = np.digitize(narrow.griddata.metpy.dequantify().values.astype('float64'), contours)
+        changed = np.mean(wideBins != narrowBins)
+        verdict = 'ok' if changed <= tolerance else 'over tolerance'
+        print(f"<precision> {wide.field}: {changed:.3%} of points change contour interval at {policy.name} ({verdict})")
+
+def StartPrefetch():
+    global prefetchThread
+    prefetchStop.clear()
+    if (prefetchThread is None) or (not prefetchThread.is_alive()):
+        prefetchThread = threading.Thread(target=PrefetchWorker, name='prefetch', daemon=True)
+        prefetchThread.start()
+
+def StopPrefetch():
+    prefetchStop.set()
+
 # The meat of the program
 def run(values, titleOverride, **Override):
     
     rewind = 0
+    session = None
     # Handle quickrun overrides
     for k in Override:
         if k == "date":
@@ -809,6 +2041,8 @@ def run(values, titleOverride, **Override):
             values.update({'factors':Override[k]})
         if k == "adtnlRwnd":
             rewind = Override[k]
+        if k == "session":
+            session = Override[k]
     
     values.update({'delta':int(values['delta'])})
     
@@ -839,47 +2073,28 @@ def run(values, titleOverride, **Override):
             steps = 120
     
 
-    # Data Acquisition
-    Data = GriddedCalculations(PullData(Time, values['delta'], rewind), level)
-    
     # Panel Preparation
     panel = declarative.MapPanel()
     panel.layout = (1, 1, 1)
     
-    # Parse custom zoom feature
-    simArea = values['area'].replace("+", "")
-    simArea = simArea.replace("-", "")
-    if simArea in area_dictionary:
-        splitArea = Counter(values['area'])
-        factor = (splitArea['+']) - (splitArea['-'])
-        scaleFactor = (1 - 2**-factor)/2
-        west, east, south, north = area_dictionary[f'{simArea}']
-        newWest = west - (west - east) * scaleFactor
-        newEast = east + (west - east) * scaleFactor
-        newSouth = south - (south - north) * scaleFactor
-        newNorth = north + (south - north) * scaleFactor
-        modArea = newWest, newEast, newSouth, newNorth
-    
-        panel.area = modArea
-    else:
-        panel.area = f'{values["area"]}'
+    panel.area = PanelArea(values['area'])
 
-    # Figuring out the data display area
-    areaZero = list(panel.area)
-    areaScaleA = 1.1
-    areaScaleB = 0.9
-    if areaZero[0] < 0:
-        areaZero[0] = 360 + (areaZero[0] * areaScaleA)
-    if areaZero[1] < 0:
-        areaZero[1] = 360 + (areaZero[1] * areaScaleB)
-    areaZero[2] = areaZero[2] * areaScaleB
-    areaZero[3] = areaZero[3] * areaScaleA
-    latSlice = slice(areaZero[3], areaZero[2])
-    lonSlice = slice(areaZero[0], areaZero[1])
-    if (Time.time >= datetime(2004, 3, 2)):
-        Data.grd = Data.grd.sel(lat=latSlice, lon=lonSlice)
+    # Data Acquisition, limited to the data display area and the fields and levels the factors need
+    factors = values['factors'].split(", ")
+    fields, levels = GriddedNeeds(factors, level)
+    Data = PullData(Time, values['delta'], rewind, DataArea(panel.area), levels, session, fields)
+    
+    # Only the derived fields that get plotted are worked out
+    if Data.grd is not None:
+        derived = DerivedFields(Data, level, session)
+        for name in FactorDerived(factors, level):
+            Data.grd[name] = derived.Get(name)
     
-    panel.layers = ['states', 'coastline', 'borders']
+    # The static map layers come from a cached raster rather than being drawn for every map
+    panel.layers = []
+    base_map = BaseMapPlot()
+    base_map.features = ['states', 'coastline', 'borders']
+    base_map.resolution = int(values['dpi'])
     
     # Parsing the panel.area into a list, and doing math on it.
     areaList = list(panel.area)
@@ -904,12 +2119,12 @@ def run(values, titleOverride, **Override):
     
     # Factor Parsing
     plotslist = []
-    factors = values['factors'].split(", ")
         # Satelite
     if ("sat_channel_2" in factors) or ("sat_channel_9" in factors) or ("sat_channel_14" in factors) or ("sat_truecolor" in factors):
         if "sat_channel_2" in factors:
-            sat_dat_2 = PullSatData('east', 2, Time.WithMinutes(),'CONUS').dat
-            sat_img = declarative.ImagePlot()
+            sat_dat_2 = PullSatData('east', 2, Time.WithMinutes(),'CONUS', panel.area).dat
+            sat_img = ResampledImagePlot()
+            sat_img.resolution = int(values['dpi'])
             sat_img.data = sat_dat_2
             sat_img.field = "Sectorized_CMI"
             sat_img.colorbar = 'horizontal'
@@ -917,29 +2132,17 @@ def run(values, titleOverride, **Override):
             plotslist.append(sat_img)
             
         if "sat_truecolor" in factors:
-            sat_trc = MakeTruecolorSat(PullSatData('east', 1, Time.WithMinutes(),'CONUS'), PullSatData('east', 2, Time.WithMinutes(),'CONUS'), PullSatData('east', 3, Time.WithMinutes(),'CONUS'))
-            
-            sat_imgr = declarative.ImagePlot()
-            sat_imgr.data = sat_trc.rdat
-            sat_imgr.field = "Sectorized_CMI"
-            sat_imgr.colormap = 'Reds'
-            plotslist.append(sat_imgr)
-            
-            sat_imgg = declarative.ImagePlot()
-            sat_imgg.data = sat_trc.gdat
-            sat_imgg.field = "Sectorized_CMI"
-            sat_imgg.colormap = 'Greens'
-            plotslist.append(sat_imgg)
-            
-            sat_imgb = declarative.ImagePlot()
-            sat_imgb.data = sat_trc.bdat
-            sat_imgb.field = "Sectorized_CMI"
-            sat_imgb.colormap = 'Blues'
-            plotslist.append(sat_imgb)
+            sat_trc = MakeTruecolorSat(PullSatData('east', 1, Time.WithMinutes(),'CONUS', panel.area), PullSatData('east', 2, Time.WithMinutes(),'CONUS', panel.area, False), PullSatData('east', 3, Time.WithMinutes(),'CONUS', panel.area))
+            sat_img = ResampledImagePlot()
+            sat_img.resolution = int(values['dpi'])
+            sat_img.data = sat_trc.dat
+            sat_img.field = "Truecolor_RGB"
+            plotslist.append(sat_img)
         
         if "sat_channel_9" in factors:
-            sat_dat_9 = PullSatData('east', 9, Time.WithMinutes(),'CONUS').dat
-            sat_img = declarative.ImagePlot()
+            sat_dat_9 = PullSatData('east', 9, Time.WithMinutes(),'CONUS', panel.area).dat
+            sat_img = ResampledImagePlot()
+            sat_img.resolution = int(values['dpi'])
             sat_img.data = sat_dat_9
             sat_img.field = "Sectorized_CMI"
             sat_img.colorbar = 'horizontal'
@@ -948,8 +2151,9 @@ def run(values, titleOverride, **Override):
             plotslist.append(sat_img)
         
         if "sat_channel_14" in factors:
-            sat_dat_14 = PullSatData('east', 14, Time.WithMinutes(),'CONUS').dat
-            sat_img = declarative.ImagePlot()
+            sat_dat_14 = PullSatData('east', 14, Time.WithMinutes(),'CONUS', panel.area).dat
+            sat_img = ResampledImagePlot()
+            sat_img.resolution = int(values['dpi'])
             sat_img.data = sat_dat_14
             sat_img.field = "Sectorized_CMI"
             sat_img.colorbar = 'horizontal'
@@ -973,7 +2177,7 @@ def run(values, titleOverride, **Override):
         if "wind_speed_fill" in factors:
             wind_speed_fill = declarative.FilledContourPlot()
             wind_speed_fill.data = Data.grd
-            wind_speed_fill.field = 'wind_speed_isobaric'
+            wind_speed_fill.field = 'wind_speed'
             wind_speed_fill.level = None
             wind_speed_fill.time = None
             wind_speed_fill.contours = list(range(10, 241, 20))
@@ -1028,7 +2232,7 @@ def run(values, titleOverride, **Override):
             thickness_500_1000.contours = list(range(0, 10000, 60))
             thickness_500_1000.clabels = True
             thickness_500_1000.linestyle = 'dashed'
-            thickness_500_1000.smooth_contour = int(values['smoothing'])
+            SmoothLayer(thickness_500_1000, Data, values, session)
             plotslist.append(thickness_500_1000)
             
         if "height_contours" in factors:
@@ -1039,7 +2243,7 @@ def run(values, titleOverride, **Override):
             pressure_heights.time = Data.plot_time
             pressure_heights.contours = list(range(0, 12000, steps))
             pressure_heights.clabels = True
-            pressure_heights.smooth_contour = int(values['smoothing'])
+            SmoothLayer(pressure_heights, Data, values, session)
             plotslist.append(pressure_heights)
     
         if "temp_contours" in factors:
@@ -1053,26 +2257,48 @@ def run(values, titleOverride, **Override):
             temp_contours.linestyle = 'dashed'
             temp_contours.clabels = True
             temp_contours.plot_units = 'degC'
-            temp_contours.smooth_contour = int(values['smoothing'])
+            SmoothLayer(temp_contours, Data, values, session)
             plotslist.append(temp_contours)
 
+        if "dewpoint_depression_fill" in factors:
+            dewpoint_depression_fill = declarative.FilledContourPlot()
+            dewpoint_depression_fill.data = Data.grd
+            dewpoint_depression_fill.field = 'dewpoint_depression'
+            dewpoint_depression_fill.level = None
+            dewpoint_depression_fill.time = None
+            dewpoint_depression_fill.contours = list(range(0, 41, 2))
+            dewpoint_depression_fill.colormap = 'YlOrBr'
+            dewpoint_depression_fill.colorbar = 'horizontal'
+            dewpoint_depression_fill.plot_units = 'delta_degC'
+            plotslist.append(dewpoint_depression_fill)
+            
         if "dew_contours" in factors:
-            hPaLevel = level * units.hPa
-            tmpIsoSel = Data.grd['Temperature_isobaric'].metpy.sel(vertical=hPaLevel)
-            rhIsoSel = Data.grd['Relative_humidity_isobaric'].metpy.sel(vertical=hPaLevel)
-            Data.grd['Dewpoint_isobaric'] = mpcalc.dewpoint_from_relative_humidity(tmpIsoSel, rhIsoSel)
             dew_contours = declarative.ContourPlot()
             dew_contours.data = Data.grd
-            dew_contours.field = 'Dewpoint_isobaric'
+            dew_contours.field = 'dewpoint'
             dew_contours.level = None
-            dew_contours.time = Data.plot_time
+            dew_contours.time = None
             dew_contours.contours = list(range(-100, 101, 5))
             dew_contours.linecolor = 'green'
             dew_contours.linestyle = 'dashed'
             dew_contours.clabels = True
-            #dew_contours.plot_units = 'degC'
-            dew_contours.smooth_contours = int(values['smoothing'])
+            dew_contours.plot_units = 'degC'
+            SmoothLayer(dew_contours, Data, values, session)
             plotslist.append(dew_contours)
+            
+        if "mixing_ratio_contours" in factors:
+            mixing_ratio_contours = declarative.ContourPlot()
+            mixing_ratio_contours.data = Data.grd
+            mixing_ratio_contours.field = 'mixing_ratio'
+            mixing_ratio_contours.level = None
+            mixing_ratio_contours.time = None
+            mixing_ratio_contours.contours = list(range(0, 31, 2))
+            mixing_ratio_contours.linecolor = 'teal'
+            mixing_ratio_contours.linestyle = 'dotted'
+            mixing_ratio_contours.clabels = True
+            mixing_ratio_contours.plot_units = 'g/kg'
+            SmoothLayer(mixing_ratio_contours, Data, values, session)
+            plotslist.append(mixing_ratio_contours)
         
         if "gridded_barbs" in factors:
             barbs = declarative.BarbPlot()
@@ -1100,7 +2326,7 @@ def run(values, titleOverride, **Override):
         if "wind_speed_fill" in factors:
             wind_speed_fill = declarative.FilledContourPlot()
             wind_speed_fill.data = Data.grd
-            wind_speed_fill.field = 'wind_speed_height_above_ground'
+            wind_speed_fill.field = 'wind_speed'
             wind_speed_fill.level = None
             wind_speed_fill.time = None
             wind_speed_fill.contours = list(range(10, 201, 20))
@@ -1143,7 +2369,7 @@ def run(values, titleOverride, **Override):
             thickness_500_1000.contours = list(range(0, 10000, 60))
             thickness_500_1000.clabels = True
             thickness_500_1000.linestyle = 'dashed'
-            thickness_500_1000.smooth_contour = int(values['smoothing'])
+            SmoothLayer(thickness_500_1000, Data, values, session)
             plotslist.append(thickness_500_1000)
 
         if "pressure_contours" in factors:
@@ -1155,7 +2381,7 @@ def run(values, titleOverride, **Override):
             pressure.contours = list(range(0, 2000, 4))
             pressure.clabels = True
             pressure.plot_units = 'hPa'
-            pressure.smooth_contour = int(values['smoothing'])
+            SmoothLayer(pressure, Data, values, session)
             plotslist.append(pressure)
             
         if "temp_contours" in factors:
@@ -1169,9 +2395,21 @@ def run(values, titleOverride, **Override):
             temp_contours.linestyle = 'dashed'
             temp_contours.clabels = True
             temp_contours.plot_units = 'degF'
-            temp_contours.smooth_contour = int(values['smoothing'])
+            SmoothLayer(temp_contours, Data, values, session)
             plotslist.append(temp_contours)
             
+        if "dewpoint_depression_fill" in factors:
+            dewpoint_depression_fill = declarative.FilledContourPlot()
+            dewpoint_depression_fill.data = Data.grd
+            dewpoint_depression_fill.field = 'dewpoint_depression'
+            dewpoint_depression_fill.level = None
+            dewpoint_depression_fill.time = None
+            dewpoint_depression_fill.contours = list(range(0, 41, 2))
+            dewpoint_depression_fill.colormap = 'YlOrBr'
+            dewpoint_depression_fill.colorbar = 'horizontal'
+            dewpoint_depression_fill.plot_units = 'delta_degC'
+            plotslist.append(dewpoint_depression_fill)
+            
         if "dew_contours" in factors:
             dew_contours = declarative.ContourPlot()
             dew_contours.data = Data.grd
@@ -1183,7 +2421,7 @@ def run(values, titleOverride, **Override):
             dew_contours.linestyle = 'dashed'
             dew_contours.clabels = True
             dew_contours.plot_units = 'degF'
-            dew_contours.smooth_contour = int(values['smoothing'])
+            SmoothLayer(dew_contours, Data, values, session)
             plotslist.append(dew_contours)
             
         if "gridded_barbs" in factors:
@@ -1209,7 +2447,7 @@ def run(values, titleOverride, **Override):
                 obs.data = Data.sfcDat
                 obs.time = Time.time
             else:
-                obs.data = Data.uaDat
+                obs.data = Data.uaLevels.get(level, Data.uaDat)
                 obs.time = Time.timeUA
 
         if "temperature" in factors:
@@ -1308,7 +2546,7 @@ def run(values, titleOverride, **Override):
         obsTitle = titleOverride
         sObsTitle = titleOverride
         
-    panel.plots = plotslist
+    panel.plots = plotslist + [base_map]
     
     if maptype == 2:
         panel.title = f"Bailey, Sam - {values['area']} {sConTitle} {Time.tsalpG}, {values['delta']} Hour Forecast"
@@ -1360,11 +2598,8 @@ def SaveMap(product, doSave, assigned, titleOverride, noShow):
     else:
         saveLocale = 'Test_Maps'
 
-    OldDir = os.path.isdir(f'../Maps/{saveLocale}/{daystamp}')
-
     if doSave:
-        if OldDir == False:
-            os.mkdir(f'../Maps/{saveLocale}/{daystamp}')
+        os.makedirs(f'../Maps/{saveLocale}/{daystamp}', exist_ok=True)
         if product['type'] == 3:
             pc.save(f"../Maps/{saveLocale}/{daystamp}/{timestampNum}, {product['values']['delta']:02d}H, {product['values']['area']} {product['values']['level']}mb {conTitle}, {product['values']['dpi']} DPI - Bailey, Sam.png", dpi=int(product['values']['dpi']), bbox_inches='tight')
             save = Image.open(f"../Maps/{saveLocale}/{daystamp}/{timestampNum}, {product['values']['delta']:02d}H, {product['values']['area']} {product['values']['level']}mb {conTitle}, {product['values']['dpi']} DPI - Bailey, Sam.png")
@@ -1387,13 +2622,68 @@ def SaveMap(product, doSave, assigned, titleOverride, noShow):
                 save.show()
         print("<run> Map successfully saved!")
     else:
-        if os.path.isdir("../Maps/Temp") == False:
-            os.mkdir("../Maps/Temp")
+        os.makedirs("../Maps/Temp", exist_ok=True)
         pc.save(f"../Maps/Temp/{titleOverride}.png", dpi=int(product['values']['dpi']), bbox_inches='tight')
         save = Image.open(f'../Maps/Temp/{titleOverride}.png')
         if noShow == False:
             save.show()
 
+# Frames waiting on the render workers. The workers are forked, so they see the built frames and
+# all the data behind them without anything being pickled; only frame numbers are sent over.
+renderQueue = []
+
+def RenderWorker():
+    plt.switch_backend('Agg')
+
+# Threads that could be partway through a fetch, holding locks that forked workers would inherit
+def BusyThreads():
+    return [thread for thread in threading.enumerate() if thread.name.startswith('fetch') or (thread is prefetchThread)]
+
+# Forks the render pool once the prefetcher has stopped and every fetch thread has finished. Gives
+# None if they are still busy after the wait, and the frames are then drawn without forking.
+def ForkPool(workers, wait=10):
+    deadline = monotonic() + wait
+    while BusyThreads() and (monotonic() < deadline):
+        sleep(0.1)
+    if BusyThreads():
+        return None
+    return multiprocessing.get_context('fork').Pool(workers, initializer=RenderWorker)
+
+def RenderFrame(job):
+    index, doSave, assigned, numbered = job
+    SaveMap(renderQueue[index], doSave, assigned, f'{index:03d}' if numbered else '', True)
+    return index
+
+# Draws and saves built frames on a pool of worker processes, each with its own Matplotlib state.
+# Numbered frames keep their order for the gif. Where processes can't be forked, or there is only
+# one frame or one worker, frames are drawn one after another as before.
+def RenderFrames(products, doSave, assigned, numbered):
+    global renderQueue
+    jobs = [(index, doSave, assigned, numbered) for index in range(len(products))]
+    workers = min(int(config.get('render', {}).get('workers', 0)) or os.cpu_count(), len(jobs))
+    renderQueue = products
+    prefetching = (prefetchThread is not None) and prefetchThread.is_alive() and (not prefetchStop.is_set())
+    pool = None
+    try:
+        if (workers > 1) and ('fork' in multiprocessing.get_all_start_methods()):
+            # Workers read nothing from disk themselves; lazily opened data is loaded here first
+            for product in products:
+                for plot in product['panel'].plots:
+                    if isinstance(getattr(plot, 'data', None), (xr.Dataset, xr.DataArray)):
+                        plot.data.load()
+            StopPrefetch()
+            pool = ForkPool(workers)
+        if pool is not None:
+            with pool:
+                pool.map(RenderFrame, jobs)
+        else:
+            for job in jobs:
+                RenderFrame(job)
+    finally:
+        renderQueue = []
+        if prefetching:
+            StartPrefetch()
+
 
 # --- End Definitions ---
 
@@ -1403,6 +2693,24 @@ def SaveMap(product, doSave, assigned, titleOverride, noShow):
 area_dictionary = dict(config['areas'])
 area_dictionary = {k: tuple(map(float, v.split(", "))) for k, v in area_dictionary.items()}
 
+dataSource = MakeSource(config.get('sources', {}))
+gridCache = DiskCache('gridded')
+derivedCache = DiskCache('derived')
+workingPrecision = np.dtype(config.get('compute', {}).get('precision', 'float32'))
+surfaceCache = DiskCache('surface')
+recentBulletins = {}
+soundingCache = DiskCache('upperair')
+soundingStore = SoundingStore()
+satCache = DiskCache('satellite')
+baseCache = DiskCache('basemap')
+satIndexes = {}
+satFrames = FrameCache()
+stationTable = None
+archiveIndex = None
+archiveLock = threading.Lock()
+prefetchThread = None
+prefetchStop = threading.Event()
+
 global quickRun
 global noShow
 quickRun = False
@@ -1512,5 +2820,8 @@ else:
     presetLoad('default')
     setInit()
     singleLoads()
+    if config.get('prefetch', {}).get('enabled', False):
+        StartPrefetch()
+        print("<prefetch> Background prefetching is on.")
 
     inputChain()
\ No newline at end of file
@@ -0,0 +1,79 @@
+# AMGP.py starts its prompt on import, so the functions under test are pulled out of its source.
+import ast
+import os
+from io import BytesIO, RawIOBase, TextIOWrapper, UnsupportedOperation
+
+import pytest
+
+metar = pytest.importorskip('metpy.io.metar')
+
+SCRIPT = os.path.join(os.path.dirname(__file__), '..', 'Scripts', 'AMGP.py')
+
+
+def load(*names):
+    with open(SCRIPT) as script:
+        tree = ast.parse(script.read())
+    scope = {'UnsupportedOperation': UnsupportedOperation}
+    nodes = [node for node in tree.body if getattr(node, 'name', None) in names]
+    exec(compile(ast.Module(nodes, []), SCRIPT, 'exec'), scope)
+    return scope
+
+
+# Behaves like an HTTP response: readable once, front to back, and unable to seek
+class Response(RawIOBase):
+    def __init__(self, data):
+        self.data = BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunk = self.data.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+    def seekable(self):
+        return False
+
+    def seek(self, *args):
+        raise UnsupportedOperation('seek')
+
+
+BULLETIN = (b'SAUS70 KWBC 011200\n'
+            b'KORD 011151Z 27010KT 10SM FEW250 M02/M09 A3012 RMK AO2 SLP205 T10221089\n'
+            b'KMDW 011153Z 26012G20KT 10SM SCT250 M01/M08 A3011 RMK AO2 SLP201 T10111083\n')
+
+
+def rewound(data):
+    RewindText = load('RewindText')['RewindText']
+    return RewindText(TextIOWrapper(Response(data), encoding='utf-8', errors='backslashreplace'))
+
+
+def test_rewind_replays_the_lead_ahead_of_the_stream():
+    bulletin = rewound(BULLETIN)
+    assert bulletin.read(4) == 'SAUS'
+    assert bulletin.seek(0) == 0
+    assert list(bulletin) == BULLETIN.decode('utf-8').splitlines(True)
+
+
+def test_rewind_reads_after_the_rewind():
+    bulletin = rewound(BULLETIN)
+    bulletin.read(4)
+    bulletin.seek(0)
+    assert bulletin.read(2) == 'SA'
+    assert bulletin.read() == BULLETIN.decode('utf-8')[2:]
+
+
+def test_rewind_only_goes_back_once():
+    bulletin = rewound(BULLETIN)
+    bulletin.read(4)
+    bulletin.seek(0)
+    with pytest.raises(UnsupportedOperation):
+        bulletin.seek(0)
+
+
+def test_metar_bulletin_from_unseekable_stream(monkeypatch):
+    # Station lookups need MetPy's station table; only the reading of the stream is under test
+    monkeypatch.setattr(metar, '_metars_to_dataframe', lambda reports, **kwargs: list(reports))
+    reports = metar.parse_metar_file(rewound(BULLETIN), year=2024, month=1)
+    assert [report[:4] for report in reports] == ['KORD', 'KMDW']